@@ -0,0 +1,113 @@
+"""Microbenchmark for converting Telethon users into UserRows
+
+Compares the old per-attribute hasattr conversion, followed by hashing each
+row twice for the user cache as the writer used to, against rows.user_rows,
+which maps a whole page with prebuilt getters and fingerprints it in the same
+pass. Users are real Telethon TL objects, served in 200-user pages like
+GetParticipantsRequest, cycled from a pool so millions of rows fit in memory.
+
+    python benchmarks/bench_rows.py
+    python benchmarks/bench_rows.py --rows 5000000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.tl.types import User, UserEmpty
+
+from rows import UserRow, user_rows
+
+def legacy_user_row(user):
+    """The conversion rows.user_row did before the getters were precomputed"""
+    return UserRow(
+        user.id,
+        user.access_hash if hasattr(user, 'access_hash') else None,
+        user.username if hasattr(user, 'username') else None,
+        user.first_name if hasattr(user, 'first_name') else None,
+        user.last_name if hasattr(user, 'last_name') else None,
+        user.phone if hasattr(user, 'phone') else None,
+        user.bot if hasattr(user, 'bot') else False,
+        user.verified if hasattr(user, 'verified') else False,
+        user.restricted if hasattr(user, 'restricted') else False,
+        user.scam if hasattr(user, 'scam') else False,
+        user.fake if hasattr(user, 'fake') else False
+    )
+
+def legacy_page(page):
+    rows = [legacy_user_row(user) for user in page]
+    # is_stored() and add() each hashed the row
+    for row in rows:
+        hash(row)
+        hash(row)
+    return rows
+
+def mapped_page(page):
+    rows, _ = user_rows(page)
+    return rows
+
+def make_pages(pool_size, page_size, empty_every):
+    users = []
+    for user_id in range(1, pool_size + 1):
+        if empty_every and user_id % empty_every == 0:
+            users.append(UserEmpty(id=user_id))
+            continue
+        users.append(User(
+            id=user_id,
+            access_hash=user_id * 31,
+            first_name=f"First{user_id}",
+            last_name=f"Last{user_id}" if user_id % 3 else None,
+            username=f"user{user_id}" if user_id % 2 else None,
+            phone=f"1555{user_id:07d}" if user_id % 7 == 0 else None,
+            bot=user_id % 97 == 0,
+            verified=user_id % 501 == 0,
+            restricted=False,
+            scam=False,
+            fake=False
+        ))
+    return [users[start:start + page_size] for start in range(0, len(users), page_size)]
+
+def run(convert, pages, total_rows):
+    """Best-effort timing of converting total_rows users page by page"""
+    converted = 0
+    started = time.perf_counter()
+    while converted < total_rows:
+        for page in pages:
+            converted += len(convert(page))
+            if converted >= total_rows:
+                break
+    return converted, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Telethon user to row conversion')
+    parser.add_argument('--rows', type=int, default=2000000, help='Users converted per run')
+    parser.add_argument('--pool', type=int, default=100000, help='Distinct Telethon users cycled through')
+    parser.add_argument('--page-size', type=int, default=200, help='Users per participants page')
+    parser.add_argument('--empty-every', type=int, default=0,
+                        help='Make every Nth user a UserEmpty to exercise the fallback path')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per variant, the best is reported')
+    args = parser.parse_args()
+    
+    pages = make_pages(args.pool, args.page_size, args.empty_every)
+    
+    # Both conversions must agree before their speed means anything
+    for page in pages:
+        if mapped_page(page) != [legacy_user_row(user) for user in page]:
+            sys.exit("user_rows and the legacy conversion disagree")
+    
+    results = {}
+    for name, convert in (('hasattr', legacy_page), ('user_rows', mapped_page)):
+        converted, seconds = min(
+            (run(convert, pages, args.rows) for _ in range(args.repeat)),
+            key=lambda result: result[1]
+        )
+        results[name] = seconds
+        print(f"{name:<10} {converted} rows in {seconds:.3f}s  "
+              f"{converted / seconds:>12,.0f} rows/s  {seconds / converted * 1e9:>7.0f} ns/row")
+    
+    print(f"speedup    {results['hasattr'] / results['user_rows']:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Offline benchmark for TelegramScraper.scrape_all_channels
+
+Drives the real scraper against FakeTelegramClient and a local database, and
+reports throughput, database round trips, commits and peak Python memory per
+scenario. No Telegram account or network access is needed.
+
+    python benchmarks/bench_scraper.py
+    python benchmarks/bench_scraper.py --backend mysql --db-host 127.0.0.1 --db-user root --reset
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import FakeTelegramClient
+from storage import MySQLStorage, SQLiteStorage
+from telegram_scraper import TelegramScraper
+from throttle import AdaptiveThrottle
+
+SCENARIOS = {
+    'small': dict(channels=5, members=1000),
+    'large-channel': dict(channels=1, members=50000),
+    'overlapping': dict(channels=20, members=5000, overlap=0.8),
+    'slow-api': dict(channels=3, members=2000, latency=0.02, jitter=0.02),
+    'flaky-api': dict(channels=5, members=2000, flood_rate=0.02, error_rate=0.02),
+}
+
+class Counters:
+    """Thread-safe tally of database round trips and commits"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self.commits = 0
+    
+    def add(self, round_trips=0, commits=0):
+        with self.lock:
+            self.round_trips += round_trips
+            self.commits += commits
+
+class CountingCursor:
+    """Cursor proxy that counts statements sent to the server"""
+    
+    def __init__(self, cursor, counters):
+        self.cursor = cursor
+        self.counters = counters
+    
+    def execute(self, *args, **kwargs):
+        self.counters.add(round_trips=1)
+        return self.cursor.execute(*args, **kwargs)
+    
+    def executemany(self, *args, **kwargs):
+        # pymysql folds INSERT ... VALUES into multi-row statements, one round trip per chunk
+        self.counters.add(round_trips=1)
+        return self.cursor.executemany(*args, **kwargs)
+    
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class CountingConnection:
+    """Connection proxy that counts round trips and commits"""
+    
+    def __init__(self, connection, counters):
+        self.connection = connection
+        self.counters = counters
+    
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self.connection.cursor(*args, **kwargs), self.counters)
+    
+    def commit(self):
+        self.counters.add(round_trips=1, commits=1)
+        return self.connection.commit()
+    
+    def rollback(self):
+        self.counters.add(round_trips=1)
+        return self.connection.rollback()
+    
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+def counting(storage_class):
+    """Subclass a storage backend so every connection it opens is counted"""
+    class CountingStorage(storage_class):
+        def open_connection(self):
+            return CountingConnection(super().open_connection(), self.counters)
+    
+    return CountingStorage
+
+def make_storage(args, counters):
+    """Fresh storage for one scenario"""
+    if args.backend == 'mysql':
+        storage = counting(MySQLStorage)({
+            'host': args.db_host,
+            'user': args.db_user,
+            'password': args.db_password,
+            'port': args.db_port,
+            'charset': 'utf8mb4',
+            'autocommit': False
+        }, database=args.db_name)
+        if args.reset:
+            reset_database(storage)
+    else:
+        storage = counting(SQLiteStorage)(os.path.join(tempfile.mkdtemp(prefix='bench-'), 'telescrape.db'))
+    
+    storage.counters = counters
+    return storage
+
+def reset_database(storage):
+    """Empty the benchmark database so every scenario starts cold"""
+    storage.counters = Counters()
+    storage.connect()
+    try:
+        cursor = storage.execute("SHOW TABLES")
+        for (table,) in cursor.fetchall():
+            storage.execute(f"TRUNCATE TABLE `{table}`")
+        storage.commit()
+    finally:
+        storage.close_pool()
+
+async def run_scenario(name, params, args):
+    """Run one scenario end to end and return its measurements"""
+    counters = Counters()
+    storage = make_storage(args, counters)
+    
+    client = FakeTelegramClient(seed=args.seed, **params)
+    scraper = TelegramScraper(
+        session_name='bench',
+        api_id=0,
+        api_hash='',
+        storage=storage,
+        write_queue_size=args.write_queue,
+        throttle=AdaptiveThrottle(min_delay=0, initial_delay=0),
+        bulk_load=tempfile.mkdtemp(prefix='bench-spool-') if args.bulk_load else None,
+        bulk_segment_rows=args.bulk_segment_rows,
+        snapshots=os.path.join(args.snapshots, name) if args.snapshots else None
+    )
+    scraper.client = client
+    
+    if not scraper.connect_database():
+        raise SystemExit("Benchmark database is not reachable")
+    setup_round_trips, setup_commits = counters.round_trips, counters.commits
+    
+    if args.memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    
+    try:
+        scraped = await scraper.scrape_all_channels()
+        # Time the flush too, otherwise a write-behind queue hides the database cost
+        await asyncio.get_running_loop().run_in_executor(None, scraper.writer.close)
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+        if args.memory:
+            tracemalloc.stop()
+        storage.close_pool()
+    
+    # Throughput counts the members actually scraped, so a broken scrape cannot report full speed
+    users = scraped or 0
+    expected = params.get('channels', 10) * params.get('members', 1000)
+    if users != expected:
+        print(f"warning: {name} scraped {users} of {expected} expected users", file=sys.stderr)
+    return {
+        'scenario': name,
+        'users': users,
+        'expected_users': expected,
+        'seconds': round(elapsed, 3),
+        'users_per_sec': round(users / elapsed, 1) if elapsed else None,
+        'db_round_trips': counters.round_trips - setup_round_trips,
+        'db_commits': counters.commits - setup_commits,
+        'api_requests': client.requests,
+        'user_cache_hits': scraper.user_cache.hits,
+        'injected_flood_waits': client.flood_waits,
+        'injected_errors': client.errors,
+        'peak_memory_mb': round(peak / 2 ** 20, 2) if peak is not None else None,
+    }
+
+def print_table(results):
+    """Print results as an aligned plain-text table"""
+    columns = ['scenario', 'users', 'seconds', 'users_per_sec', 'db_round_trips', 'db_commits',
+               'api_requests', 'user_cache_hits', 'peak_memory_mb']
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scraper offline')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite',
+                        help='Database to benchmark against: a temporary SQLite file or a local MySQL')
+    parser.add_argument('--db-host', type=str, default='127.0.0.1', help='Local MySQL host')
+    parser.add_argument('--db-port', type=int, default=3306, help='Local MySQL port')
+    parser.add_argument('--db-user', type=str, default='root', help='Local MySQL user')
+    parser.add_argument('--db-password', type=str, default='', help='Local MySQL password')
+    parser.add_argument('--db-name', type=str, default='telescrape_bench',
+                        help='Local MySQL database to benchmark in; created if missing')
+    parser.add_argument('--reset', action='store_true',
+                        help='With --backend mysql, TRUNCATE every table in --db-name before each scenario; '
+                             'refused unless the name contains "bench"')
+    parser.add_argument('--write-queue', type=int, default=20, help='Writer queue size passed to the scraper')
+    parser.add_argument('--bulk-load', action='store_true', help='Spool to staging files and bulk-load, as --bulk-load does')
+    parser.add_argument('--bulk-segment-rows', type=int, default=500000, help='Rows per bulk-load segment')
+    parser.add_argument('--snapshots', type=str, metavar='DIR',
+                        help='Save membership snapshots under DIR/<scenario>, as --snapshots does')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Skip tracemalloc, which slows Python down noticeably')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for injected latency and errors')
+    parser.add_argument('--json', type=str, help='Also write results to this JSON file')
+    
+    args = parser.parse_args()
+    if args.reset and args.backend == 'mysql' and 'bench' not in args.db_name.lower():
+        parser.error(f"--reset empties every table in {args.db_name!r}; "
+                     f"it is only allowed on a database whose name contains 'bench'")
+    
+    # Per-page INFO lines would dominate the timings
+    logging.getLogger('telegram_scraper').setLevel(logging.WARNING)
+    logging.getLogger('storage').setLevel(logging.WARNING)
+    logging.getLogger('throttle').setLevel(logging.ERROR)
+    
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        results.append(await run_scenario(name, SCENARIOS[name], args))
+    
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+import asyncio
+import random
+from datetime import datetime
+
+from telethon.errors import ChannelInvalidError, FloodWaitError, ServerError
+from telethon.tl.functions.channels import GetChannelsRequest, GetParticipantsRequest, GetFullChannelRequest
+from telethon.tl.types import Channel, ChatPhotoEmpty, User
+from telethon.tl.types.channels import ChannelParticipants, ChannelParticipantsNotModified
+from telethon.tl.types.messages import Chats
+
+from telegram_scraper import participants_hash
+
+class FakeDialog:
+    """Just enough of a Telethon Dialog for the scraper and its paging"""
+    
+    def __init__(self, entity, message_id):
+        self.entity = entity
+        self.input_entity = entity
+        self.date = entity.date
+        self.message = type('FakeMessage', (), {'id': message_id})()
+
+class FakeFullChannel:
+    """Response shape of GetFullChannelRequest"""
+    
+    def __init__(self, participants_count):
+        self.full_chat = type('FakeChannelFull', (), {'participants_count': participants_count})()
+
+class FakeTelegramClient:
+    """In-process stand-in for TelegramClient that serves generated dialogs and participants
+    
+    Users and channels are real Telethon TL objects, so memory use and attribute
+    access match a live run. Latency, flood waits and server errors are injected
+    per request from a seeded RNG so scenarios are repeatable.
+    """
+    
+    def __init__(self, channels=10, members=1000, overlap=0.0, latency=0.0, jitter=0.0,
+                 flood_rate=0.0, flood_seconds=0, error_rate=0.0, seed=1):
+        self.members = members
+        self.overlap = overlap
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.flood_waits = 0
+        self.errors = 0
+        
+        self.channels = [
+            Channel(
+                id=1000000 + i,
+                title=f"Bench channel {i}",
+                photo=ChatPhotoEmpty(),
+                date=datetime(2024, 1, 1),
+                megagroup=True,
+                access_hash=self.random.getrandbits(63),
+                username=f"bench_channel_{i}"
+            )
+            for i in range(channels)
+        ]
+        self.by_id = {channel.id: index for index, channel in enumerate(self.channels)}
+    
+    async def connect(self):
+        pass
+    
+    async def disconnect(self):
+        pass
+    
+    async def is_user_authorized(self):
+        return True
+    
+    async def get_me(self):
+        return self.make_user(1)
+    
+    async def get_dialogs(self, limit=None, offset_date=None, offset_id=0, offset_peer=None):
+        """One page of dialogs, newest message first, starting after the offset message"""
+        await self.roundtrip()
+        # Message ids fall down the dialog list, as they do for dialogs sorted by last activity
+        dialogs = [FakeDialog(channel, len(self.channels) - index) for index, channel in enumerate(self.channels)]
+        if offset_id:
+            dialogs = [dialog for dialog in dialogs if dialog.message.id < offset_id]
+        return dialogs if limit is None else dialogs[:limit]
+    
+    async def get_entity(self, entity):
+        await self.roundtrip()
+        if isinstance(entity, Channel):
+            return entity
+        return self.channels[self.by_id[getattr(entity, 'channel_id', entity)]]
+    
+    async def __call__(self, request):
+        await self.roundtrip()
+        
+        if isinstance(request, GetFullChannelRequest):
+            return FakeFullChannel(self.members)
+        if isinstance(request, GetParticipantsRequest):
+            return self.participants_page(request)
+        if isinstance(request, GetChannelsRequest):
+            return self.channels_by_peer(request)
+        raise NotImplementedError(type(request).__name__)
+    
+    async def roundtrip(self):
+        """Simulate network latency and injected failures for one request"""
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise ServerError(request=None, message='RPC_CALL_FAIL', code=500)
+    
+    def member_ids(self, channel_index, offset, limit):
+        """Deterministic user ids for one page, with a shared pool to model overlapping channels"""
+        ids = []
+        for position in range(offset, min(offset + limit, self.members)):
+            if self.overlap and (position * 7919 + channel_index) % 1000 < self.overlap * 1000:
+                ids.append(10 ** 9 + position)
+            else:
+                ids.append(2 * 10 ** 9 + channel_index * self.members + position)
+        return ids
+    
+    def make_user(self, user_id):
+        """Build a Telethon User with a realistic mix of optional fields"""
+        return User(
+            id=user_id,
+            access_hash=user_id * 31,
+            first_name=f"First{user_id}",
+            last_name=f"Last{user_id}" if user_id % 3 else None,
+            username=f"user{user_id}" if user_id % 2 else None,
+            bot=user_id % 97 == 0,
+            verified=user_id % 501 == 0
+        )
+    
+    def channels_by_peer(self, request):
+        """Answer GetChannelsRequest, rejecting access hashes that don't match like the real server"""
+        chats = []
+        for peer in request.id:
+            channel = self.channels[self.by_id[peer.channel_id]]
+            if peer.access_hash != channel.access_hash:
+                raise ChannelInvalidError(request=None)
+            chats.append(channel)
+        return Chats(chats=chats)
+    
+    def participants_page(self, request):
+        """Answer GetParticipantsRequest, honoring the page hash like the real server"""
+        channel = request.channel
+        channel_index = self.by_id[channel.id if hasattr(channel, 'id') else channel.channel_id]
+        ids = self.member_ids(channel_index, request.offset, request.limit)
+        
+        if request.hash and ids and participants_hash(ids) == request.hash:
+            return ChannelParticipantsNotModified()
+        
+        return ChannelParticipants(
+            count=self.members,
+            participants=[],
+            chats=[],
+            users=[self.make_user(user_id) for user_id in ids]
+        )
@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+import shutil
+
+logger = logging.getLogger(__name__)
+
+# Staged files use MySQL's LOAD DATA defaults: tab-separated, newline-terminated,
+# backslash escapes and \N for NULL
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+UNESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+ESCAPED = re.compile(r'\\(.)', re.DOTALL)
+
+def format_field(value):
+    if value is None:
+        return '\\N'
+    if value is True or value is False:
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return value.translate(ESCAPES)
+
+def format_line(row):
+    return '\t'.join(map(format_field, row)) + '\n'
+
+def parse_field(field):
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+    return ESCAPED.sub(lambda match: UNESCAPES.get(match.group(1), match.group(1)), field)
+
+def read_staged(path):
+    """Rows of a staged file as tuples of strings and None"""
+    with open(path, encoding='utf-8', newline='\n') as f:
+        for line in f:
+            yield tuple(map(parse_field, line[:-1].split('\t')))
+
+class StagingSpool:
+    """Scraped rows spooled to local files, in segments that are loaded whole
+    
+    Rows are appended to one file per table in a segment-NNNNNN.part
+    directory. A full segment is fsynced and sealed by renaming it without
+    .part; the writer then bulk-loads and merges it in one transaction and
+    removes it only after that commits. Checkpoints are written into the
+    segment holding the pages they cover, so a crash loses at most the
+    unsealed segment, and --resume scrapes those pages again. Sealed
+    segments left behind are merged by the next run before it starts.
+    """
+    
+    def __init__(self, directory, segment_rows=500000):
+        self.directory = os.path.abspath(directory)
+        self.segment_rows = segment_rows
+        self.sequence = 0
+        self.segment = None
+        self.files = {}
+        self.rows = 0
+        # Only the last value per key matters, so these are kept in memory until sealing
+        self.checkpoints = {}
+        self.page_hashes = {}
+    
+    def recover(self):
+        """Sealed segments left by an earlier run, oldest first; unsealed ones are dropped"""
+        os.makedirs(self.directory, exist_ok=True)
+        sealed = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.startswith('segment-'):
+                continue
+            
+            path = os.path.join(self.directory, name)
+            self.sequence = max(self.sequence, int(name[len('segment-'):].split('.')[0]))
+            if name.endswith('.part'):
+                logger.warning(f"Dropping unsealed bulk-load segment {path}")
+                shutil.rmtree(path)
+            else:
+                sealed.append(path)
+        
+        if sealed:
+            logger.info(f"Found {len(sealed)} bulk-load segments from an earlier run")
+        return sealed
+    
+    @property
+    def full(self):
+        return self.rows >= self.segment_rows
+    
+    def write(self, table, rows):
+        """Append rows to the open segment's file for table"""
+        if self.segment is None:
+            self.sequence += 1
+            self.segment = os.path.join(self.directory, f'segment-{self.sequence:06d}.part')
+            os.makedirs(self.segment)
+        
+        f = self.files.get(table)
+        if f is None:
+            f = self.files[table] = open(os.path.join(self.segment, f'{table}.tsv'), 'w',
+                                         encoding='utf-8', newline='\n')
+        f.writelines(map(format_line, rows))
+        self.rows += len(rows)
+    
+    def checkpoint(self, channel_id, offset, completed=False):
+        self.checkpoints[channel_id] = (offset, completed)
+    
+    def page_hash(self, channel_id, page_offset, page_hash, page_size):
+        self.page_hashes[(channel_id, page_offset)] = (page_hash, page_size)
+    
+    def seal(self):
+        """Make the open segment durable and ready to merge; returns its path, or None if empty"""
+        if self.page_hashes:
+            self.write('participant_pages', [key + value for key, value in self.page_hashes.items()])
+        if self.checkpoints:
+            self.write('scrape_checkpoints', [(channel_id, *state) for channel_id, state in self.checkpoints.items()])
+        if self.segment is None:
+            return None
+        
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        
+        sealed = self.segment[:-len('.part')]
+        os.rename(self.segment, sealed)
+        
+        self.segment = None
+        self.files = {}
+        self.rows = 0
+        self.checkpoints = {}
+        self.page_hashes = {}
+        return sealed
+    
+    @staticmethod
+    def staged_files(segment):
+        """{table: path} for the files of a sealed segment"""
+        return {
+            name[:-len('.tsv')]: os.path.join(segment, name)
+            for name in os.listdir(segment) if name.endswith('.tsv')
+        }
+    
+    @staticmethod
+    def remove(segment):
+        shutil.rmtree(segment)
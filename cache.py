@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+from rows import summary_flags
+
+# Low bits of a cache entry holding the stored row's summary flags
+FLAG_BITS = 3
+
+class UserCache:
+    """Bounded LRU of user id -> fingerprint of the stored users row
+    
+    A user whose fingerprint matches what we last wrote doesn't need its
+    users row upserted again, only the cheap user_channel link. Each entry
+    also carries the summary flags of the stored row, so the summary deltas
+    of overwriting it are known without reading it back. While the cache is
+    complete (it was filled with every stored user and nothing was evicted
+    since) a user it does not hold is not stored at all.
+    """
+    
+    def __init__(self, max_size=200000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.complete = False
+    
+    @staticmethod
+    def fingerprint(row):
+        return hash(row)
+    
+    def is_stored(self, row, fingerprint=None):
+        """Check whether row is exactly what we last stored for this user"""
+        stored = self.entries.get(row.id)
+        if stored is not None and stored >> FLAG_BITS == (self.fingerprint(row) if fingerprint is None else fingerprint):
+            self.entries.move_to_end(row.id)
+            self.hits += 1
+            return True
+        
+        self.misses += 1
+        return False
+    
+    def add(self, rows, fingerprints=None):
+        """Remember rows that were just committed"""
+        if not self.max_size:
+            return
+        
+        if fingerprints is None:
+            fingerprints = map(self.fingerprint, rows)
+        for row, fingerprint in zip(rows, fingerprints):
+            self.entries[row.id] = fingerprint << FLAG_BITS | summary_flags(row)
+            self.entries.move_to_end(row.id)
+        
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.complete = False
+    
+    def stored_flags(self, rows):
+        """{user_id: summary flags of the stored row, or None when not stored} for the users known here"""
+        mask = (1 << FLAG_BITS) - 1
+        entries = self.entries
+        if self.complete:
+            return {row.id: entries[row.id] & mask if row.id in entries else None for row in rows}
+        return {row.id: entries[row.id] & mask for row in rows if row.id in entries}
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {len(self.entries)} cached"
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from scheduler import channel_names, normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed channel is tried again, doubled after each further failure
+FAILURE_BACKOFF = 300
+
+def parse_schedule(entries):
+    """[(name, hours)] from --schedule NAME=HOURS options"""
+    schedule = []
+    for entry in entries:
+        name, separator, hours = entry.rpartition('=')
+        if not separator or not name:
+            raise ValueError(f"Expected NAME=HOURS, got {entry!r}")
+        schedule.append((normalize_name(name), float(hours)))
+    return schedule
+
+class ScrapeDaemon:
+    """Keeps one scraper connected and re-scrapes each channel once it is stale
+    
+    Telegram and the database are connected and the schema checked once.
+    After that the daemon loops: it lists dialogs every relist_minutes and
+    scrapes every known channel whose last scrape is older than its refresh
+    interval, stalest first, then sleeps until the next one is due. The
+    interval is refresh_hours unless a schedule entry names the channel.
+    
+    A local HTTP control interface answers GET /status, POST /refresh (all
+    channels, or ?channel=NAME), POST /drain (finish the current channel,
+    flush and exit) and POST /stop (abandon the current channel, flush and
+    exit). SIGTERM drains and SIGINT stops.
+    """
+    
+    def __init__(self, scraper, refresh_hours=24, schedule=(), relist_minutes=60, control_port=None):
+        if scraper.resume:
+            raise ValueError("A daemon scrapes finished channels again, so it cannot resume")
+        if scraper.bulk_load:
+            raise ValueError("A daemon never ends the run that merges the last bulk-load segment")
+        self.scraper = scraper
+        self.refresh_seconds = refresh_hours * 3600
+        self.schedule = list(schedule)
+        self.relist_seconds = relist_minutes * 60
+        self.control_port = control_port
+        self.server = None
+        self.loop = None
+        self.wake = None
+        self.state = 'starting'
+        self.started = time.time()
+        self.next_listing = 0
+        # channel id -> epoch seconds of the last scrape
+        self.scraped_at = {}
+        # channel id -> (consecutive failed scrapes, epoch seconds of the next attempt)
+        self.failures = {}
+        self.requested = []
+        self.requested_names = []
+        self.current = None
+        self.current_task = None
+        self.current_started = None
+        self.rounds = 0
+        self.channels_scraped = 0
+        self.users_scraped = 0
+    
+    def interval(self, entity):
+        names = channel_names(entity)
+        for name, hours in self.schedule:
+            if name in names:
+                return hours * 3600
+        return self.refresh_seconds
+    
+    def due_at(self, entity):
+        # A failed channel waits out its backoff, whatever its stored scrape time says
+        if entity.id in self.failures:
+            return self.failures[entity.id][1]
+        scraped_at = self.scraped_at.get(entity.id)
+        return 0 if scraped_at is None else scraped_at + self.interval(entity)
+    
+    def due_channels(self):
+        """Channels to scrape now: requested ones first, then stale ones, stalest first"""
+        now = time.time()
+        entities = self.scraper.entities.entities
+        requested = [entities[channel_id] for channel_id in self.requested if channel_id in entities]
+        stale = sorted(
+            (entity for entity in entities.values() if entity.id not in self.requested and self.due_at(entity) <= now),
+            key=self.due_at
+        )
+        return requested + stale
+    
+    async def discover(self):
+        """List dialogs again so new channels are scheduled and entities stay fresh"""
+        self.state = 'listing'
+        storage = self.scraper.storage
+        # Each read ends its transaction, so a long-lived connection never sees an old snapshot
+        self.scraper.channel_state = storage.transaction(storage.load_channel_state)
+        self.scraper.entities.load(storage.transaction(storage.load_access_hashes))
+        now = time.time()
+        for channel_id, (_, age_seconds) in self.scraper.channel_state.items():
+            if age_seconds is not None:
+                self.scraped_at[channel_id] = now - age_seconds
+        
+        found = 0
+        async for entity in self.scraper.scheduler.channels(self.scraper.client, self.scraper.throttle,
+                                                            self.scraper.channel_state, self.scraper.entities):
+            self.scraper.entities.add(entity)
+            found += 1
+        
+        # Refreshes asked for by name before the channel had been listed
+        for name in self.requested_names:
+            for entity in self.scraper.entities.entities.values():
+                if name in channel_names(entity) and entity.id not in self.requested:
+                    self.requested.append(entity.id)
+        self.requested_names = []
+        
+        self.next_listing = time.monotonic() + self.relist_seconds
+        logger.info(f"Listed {found} channels to keep fresh")
+    
+    async def scrape(self, entity):
+        if self.scraper.incremental:
+            self.scraper.load_checkpoints()
+        
+        self.state = 'scraping'
+        self.current = entity
+        self.current_started = time.time()
+        self.current_task = asyncio.create_task(self.scraper.scrape_channel(entity))
+        scraped = None
+        try:
+            scraped = await self.current_task
+        except asyncio.CancelledError:
+            # Only /stop cancels a scrape; anything else cancelling the daemon propagates
+            if self.state != 'stopping':
+                raise
+            logger.info(f"Stopped scraping {entity.title} midway")
+        finally:
+            self.current = None
+            self.current_task = None
+        
+        if scraped is not None:
+            self.users_scraped += scraped
+            self.channels_scraped += 1
+            self.scraped_at[entity.id] = time.time()
+            self.failures.pop(entity.id, None)
+        elif self.state != 'stopping':
+            failed = self.failures.get(entity.id, (0, None))[0] + 1
+            delay = min(FAILURE_BACKOFF * 2 ** (failed - 1), self.interval(entity))
+            self.failures[entity.id] = (failed, time.time() + delay)
+            logger.info(f"Scraping {entity.title} failed {failed} time(s) in a row, retrying in {delay / 60:.0f} minutes")
+        
+        if entity.id in self.requested:
+            self.requested.remove(entity.id)
+    
+    async def idle(self):
+        """Sleep until the next channel is due, the next listing, or a control command"""
+        self.state = 'idle'
+        now = time.time()
+        next_due = min((self.due_at(entity) for entity in self.scraper.entities.entities.values()), default=None)
+        timeout = self.next_listing - time.monotonic()
+        if next_due is not None:
+            timeout = min(timeout, next_due - now)
+        
+        self.wake.clear()
+        try:
+            await asyncio.wait_for(self.wake.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+    
+    @property
+    def finishing(self):
+        return self.state in ('draining', 'stopping')
+    
+    async def run(self):
+        """Connect once, then keep channels fresh until drained or stopped"""
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+        
+        if not await self.scraper.connect_telegram():
+            return
+        if not self.scraper.connect_database():
+            await self.scraper.client.disconnect()
+            return
+        
+        self.add_signal_handlers()
+        if self.control_port is not None:
+            self.serve(self.control_port)
+        
+        try:
+            while not self.finishing:
+                if time.monotonic() >= self.next_listing:
+                    try:
+                        await self.discover()
+                    except Exception as e:
+                        # Channels already known stay scheduled; the listing is retried at the next relist
+                        logger.error(f"Listing channels failed: {e}")
+                        self.next_listing = time.monotonic() + self.relist_seconds
+                    if self.finishing:
+                        break
+                
+                # Picked one at a time so refresh requests jump the queue
+                due = self.due_channels()
+                if due:
+                    await self.scrape(due[0])
+                else:
+                    self.rounds += 1
+                    await self.idle()
+        finally:
+            logger.info(f"Daemon exiting after {self.channels_scraped} channel scrapes, flushing writes")
+            self.close()
+            await self.scraper.shutdown()
+    
+    def add_signal_handlers(self):
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self.drain)
+            self.loop.add_signal_handler(signal.SIGINT, self.stop)
+        except (NotImplementedError, RuntimeError):
+            # Not supported on this platform or not on the main thread
+            pass
+    
+    # Control commands, run on the event loop
+    
+    def drain(self):
+        """Finish the channel in progress, then exit"""
+        if not self.finishing:
+            logger.info("Draining: exiting after the current channel")
+            self.state = 'draining'
+        self.wake.set()
+    
+    def stop(self):
+        """Abandon the channel in progress, flush what was scraped and exit"""
+        logger.info("Stopping")
+        self.state = 'stopping'
+        if self.current_task:
+            self.current_task.cancel()
+        self.wake.set()
+    
+    def refresh(self, name=None):
+        """Queue channels for scraping now; returns how many were queued"""
+        entities = self.scraper.entities.entities.values()
+        if name is None:
+            matched = [entity.id for entity in entities]
+        else:
+            name = normalize_name(name)
+            matched = [entity.id for entity in entities if name in channel_names(entity)]
+            if not matched:
+                # Maybe a channel joined since the last listing
+                self.requested_names.append(name)
+                self.next_listing = 0
+        
+        self.requested.extend(channel_id for channel_id in matched if channel_id not in self.requested)
+        self.wake.set()
+        return len(matched)
+    
+    def status(self):
+        now = time.time()
+        entities = self.scraper.entities.entities.values()
+        upcoming = sorted(entities, key=self.due_at)[:10]
+        return {
+            'state': self.state,
+            'uptime_seconds': round(now - self.started),
+            'current_channel': {
+                'id': self.current.id,
+                'title': self.current.title,
+                'seconds': round(now - self.current_started),
+            } if self.current else None,
+            'rounds': self.rounds,
+            'channels_scraped': self.channels_scraped,
+            'users_scraped': self.users_scraped,
+            'failing_channels': len(self.failures),
+            'known_channels': len(self.scraper.entities.entities),
+            'requested': list(self.requested) + self.requested_names,
+            'next_due': [
+                {'id': entity.id, 'title': entity.title, 'due_in_seconds': round(max(self.due_at(entity) - now, 0))}
+                for entity in upcoming
+            ],
+            'write_queue_depth': self.scraper.writer.queue.qsize() if self.scraper.writer else 0,
+        }
+    
+    def control(self, command, channel=None):
+        """Run a control command, returning (HTTP status, JSON-serialisable body)"""
+        if command == 'status':
+            return 200, self.status()
+        if command == 'refresh':
+            queued = self.refresh(channel)
+            if channel is not None and not queued:
+                return 202, {'queued': 0, 'note': 'channel not listed yet, listing dialogs again'}
+            return 200, {'queued': queued}
+        if command == 'drain':
+            self.drain()
+            return 200, {'state': self.state}
+        if command == 'stop':
+            self.stop()
+            return 200, {'state': self.state}
+        return 404, {'error': f'unknown command {command}'}
+    
+    def serve(self, port, host='127.0.0.1'):
+        """Expose the control commands over HTTP from a daemon thread"""
+        daemon = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def handle_command(self, allowed):
+                url = urlsplit(self.path)
+                command = url.path.strip('/')
+                if command not in allowed:
+                    self.send_error(405 if command in ('status', 'refresh', 'drain', 'stop') else 404)
+                    return
+                
+                channel = parse_qs(url.query).get('channel', [None])[0]
+                
+                # State lives on the event loop, so commands run there
+                async def run():
+                    return daemon.control(command, channel)
+                
+                status, payload = asyncio.run_coroutine_threadsafe(run(), daemon.loop).result(timeout=10)
+                
+                body = (json.dumps(payload, indent=2) + '\n').encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                self.handle_command(('status',))
+            
+            def do_POST(self):
+                self.handle_command(('refresh', 'drain', 'stop'))
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='daemon-control', daemon=True).start()
+        logger.info(f"Control interface on http://{host}:{self.server.server_port}/status")
+    
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
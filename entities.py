@@ -0,0 +1,115 @@
+import logging
+
+from telethon.errors import ChannelInvalidError, ChannelPrivateError
+from telethon.tl.functions.channels import GetChannelsRequest
+from telethon.tl.types import Channel, InputPeerChannel, PeerChannel
+
+logger = logging.getLogger(__name__)
+
+# Telegram's answer to a request made with an access hash it no longer accepts
+STALE_HASH_ERRORS = (ChannelInvalidError, ChannelPrivateError)
+
+class EntityCache:
+    """Channel entities and access hashes for the run, so channels are resolved without network calls
+    
+    Entities from the dialog listing are used as they are. Access hashes
+    stored in the channels table by earlier runs are loaded at startup, so
+    channels known only by id (an --include of ids, which skips the dialog
+    listing) are fetched together with one GetChannelsRequest instead of
+    being looked up one by one. A hash Telegram rejects is dropped and the
+    entity fetched afresh; the new hash reaches the channels table with the
+    next save_channel.
+    """
+    
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.entities = {}
+        self.access_hashes = {}
+    
+    def load(self, access_hashes):
+        """Add stored {channel_id: access_hash}; hashes from this run's entities take precedence"""
+        for channel_id, access_hash in access_hashes.items():
+            if access_hash is not None:
+                self.access_hashes.setdefault(channel_id, access_hash)
+    
+    def add(self, entity):
+        self.entities[entity.id] = entity
+        # min entities carry a hash that only works in the context they came from
+        if entity.access_hash is not None and not getattr(entity, 'min', False):
+            self.access_hashes[entity.id] = entity.access_hash
+    
+    def input_peer(self, channel_id):
+        """InputPeerChannel from the known access hash, or None"""
+        access_hash = self.access_hashes.get(channel_id)
+        return None if access_hash is None else InputPeerChannel(channel_id, access_hash)
+    
+    def invalidate(self, channel_id):
+        self.entities.pop(channel_id, None)
+        self.access_hashes.pop(channel_id, None)
+    
+    def count(self, result):
+        if self.metrics:
+            self.metrics.inc('telescrape_entity_lookups_total', result=result)
+    
+    async def resolve(self, client, throttle, channel):
+        """Channel entity for an entity, channel id or username, fetched only when not cached"""
+        if isinstance(channel, Channel):
+            self.add(channel)
+            self.count('cached')
+            return channel
+        
+        channel_id = channel if isinstance(channel, int) else None
+        if channel_id in self.entities:
+            self.count('cached')
+            return self.entities[channel_id]
+        
+        entity = None
+        peer = self.input_peer(channel_id)
+        if peer is not None:
+            try:
+                # Telethon turns the peer into the InputChannel the request takes
+                result = await throttle.call(client, GetChannelsRequest([peer]))
+                entity = result.chats[0]
+                self.count('stored_hash')
+            except STALE_HASH_ERRORS:
+                logger.info(f"Stored access hash of channel {channel_id} is stale, resolving it again")
+                self.invalidate(channel_id)
+        
+        if entity is None:
+            entity = await throttle.call(client.get_entity, PeerChannel(channel_id) if channel_id else channel)
+            self.count('fetched')
+        
+        self.add(entity)
+        return entity
+    
+    async def resolve_ids(self, client, throttle, channel_ids):
+        """Entities for channel ids in the order given; those with stored hashes come in one request"""
+        peers = [self.input_peer(channel_id) for channel_id in channel_ids if channel_id not in self.entities]
+        peers = [peer for peer in peers if peer is not None]
+        fetched = set()
+        if peers:
+            try:
+                result = await throttle.call(client, GetChannelsRequest(peers))
+                for entity in result.chats:
+                    self.add(entity)
+                    fetched.add(entity.id)
+                    self.count('stored_hash')
+            except STALE_HASH_ERRORS:
+                # One stale hash fails the whole request; resolve() then tries each channel on its own
+                logger.info("A stored access hash is stale, resolving the included channels one by one")
+        
+        entities = []
+        for channel_id in channel_ids:
+            if channel_id in fetched:
+                entities.append(self.entities[channel_id])
+                continue
+            try:
+                entities.append(await self.resolve(client, throttle, channel_id))
+            except (ValueError, *STALE_HASH_ERRORS) as e:
+                logger.warning(f"Could not resolve channel {channel_id}: {e}")
+        return entities
+    
+    async def refresh(self, client, throttle, channel_id):
+        """Drop a channel whose hash was rejected and fetch its entity again"""
+        self.invalidate(channel_id)
+        return await self.resolve(client, throttle, channel_id)
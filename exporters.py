@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+
+# Field names for JSON Lines and Parquet; CSV keeps its human-readable headers
+EXPORT_FIELDS = (
+    'user_id', 'access_hash', 'username', 'first_name', 'last_name', 'phone',
+    'is_bot', 'is_verified', 'is_restricted', 'is_scam', 'is_fake', 'channels'
+)
+
+CSV_HEADERS = (
+    'User ID', 'Access Hash', 'Username', 'First Name', 'Last Name',
+    'Phone', 'Is Bot', 'Is Verified', 'Is Restricted', 'Is Scam',
+    'Is Fake', 'Channels'
+)
+
+FLAG_FIELDS = ('is_bot', 'is_verified', 'is_restricted', 'is_scam', 'is_fake')
+
+def as_record(row):
+    """Turn an exported row into a dict with real booleans"""
+    record = dict(zip(EXPORT_FIELDS, row))
+    for field in FLAG_FIELDS:
+        if record[field] is not None:
+            record[field] = bool(record[field])
+    return record
+
+class CSVExporter:
+    """Channels joined with '; ' into a single column"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_HEADERS)
+    
+    def write(self, rows):
+        self.writer.writerows((*row[:-1], '; '.join(filter(None, row[-1]))) for row in rows)
+    
+    def close(self):
+        self.file.close()
+
+class JSONLinesExporter:
+    """One JSON object per user, channels as a list"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+    
+    def write(self, rows):
+        self.file.writelines(json.dumps(as_record(row), ensure_ascii=False) + '\n' for row in rows)
+    
+    def close(self):
+        self.file.close()
+
+class ParquetExporter:
+    """Parquet file written one row group per batch, channels as list<string>"""
+    
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+        
+        self.pa = pa
+        self.schema = pa.schema([
+            ('user_id', pa.int64()),
+            ('access_hash', pa.int64()),
+            ('username', pa.string()),
+            ('first_name', pa.string()),
+            ('last_name', pa.string()),
+            ('phone', pa.string()),
+            *((field, pa.bool_()) for field in FLAG_FIELDS),
+            ('channels', pa.list_(pa.string())),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+    
+    def write(self, rows):
+        records = [as_record(row) for row in rows]
+        self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+    
+    def close(self):
+        self.writer.close()
+
+EXPORTERS = {
+    'csv': CSVExporter,
+    'jsonl': JSONLinesExporter,
+    'parquet': ParquetExporter,
+}
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+}
+
+def create_exporter(path, format=None):
+    """Exporter for format, or guessed from the file extension (CSV if unknown)"""
+    if format is None:
+        format = EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+    return EXPORTERS[format](path)
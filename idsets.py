@@ -0,0 +1,30 @@
+from array import array
+from bisect import bisect_left
+
+def sorted_ids(ids):
+    """Compact sorted array of 64-bit ids, duplicates removed"""
+    ids = array('q', sorted(ids))
+    # Duplicates are neighbours once sorted, so they are squeezed out in place without a set
+    kept = 0
+    for value in ids:
+        if not kept or ids[kept - 1] != value:
+            ids[kept] = value
+            kept += 1
+    del ids[kept:]
+    return ids
+
+def contains(ids, value):
+    """Membership test on a sorted id array in O(log n)"""
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+def difference(left, right):
+    """Ids in sorted left that are not in sorted right, in one merge pass"""
+    result = array('q')
+    j = 0
+    for value in left:
+        while j < len(right) and right[j] < value:
+            j += 1
+        if j == len(right) or right[j] != value:
+            result.append(value)
+    return result
@@ -0,0 +1,192 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a fast local SQLite commit up to a long flood wait
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help) for everything the scraper records
+METRICS = {
+    'telescrape_api_request_seconds': ('histogram', 'Telegram request latency, excluding throttle sleeps'),
+    'telescrape_api_errors_total': ('counter', 'Telegram requests that failed and were retried'),
+    'telescrape_throttle_sleep_seconds_total': ('counter', 'Time spent sleeping for pacing and flood waits'),
+    'telescrape_db_write_seconds': ('histogram', 'Time the writer thread spent on each queued write'),
+    'telescrape_writer_backpressure_seconds_total': ('counter', 'Time scraping waited for room in the write queue'),
+    'telescrape_write_queue_depth': ('gauge', 'Writes waiting for the writer thread'),
+    'telescrape_pages_total': ('counter', 'Participant pages fetched'),
+    'telescrape_users_scraped_total': ('counter', 'Users fetched from participant pages'),
+    'telescrape_channel_seconds': ('histogram', 'Wall time spent scraping each channel'),
+    'telescrape_entity_lookups_total': ('counter', 'Channel entity lookups: cached, by stored access hash, or fetched'),
+}
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+    
+    def cumulative(self):
+        """(upper bound, count) pairs ending with +Inf"""
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+class Metrics:
+    """Counters, gauges and histograms for one scraper run
+    
+    Recorded from the event loop and the writer thread alike. Exposed in
+    the Prometheus text format by serve() and summarised by report().
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.values = {}
+        self.histograms = {}
+        self.channels = []
+        self.server = None
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+    
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the time spent in the block, also across awaits"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    def channel_done(self, channel_id, title, users, seconds, unchanged_pages=0):
+        """Record the outcome of one channel for the run report"""
+        self.observe('telescrape_channel_seconds', seconds)
+        with self.lock:
+            self.channels.append({
+                'channel_id': channel_id,
+                'title': title,
+                'users': users,
+                'unchanged_pages': unchanged_pages,
+                'seconds': round(seconds, 3),
+                'users_per_sec': round(users / seconds, 1) if seconds else None,
+            })
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            values = sorted(self.values.items())
+            histograms = sorted(self.histograms.items())
+            
+            lines = []
+            for name, (kind, help) in METRICS.items():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in values:
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                for (metric, labels), histogram in histograms:
+                    if metric != name:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        
+        return '\n'.join(lines) + '\n'
+    
+    def report(self):
+        """Run summary as a JSON-serialisable dict"""
+        with self.lock:
+            return {
+                'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'duration_seconds': round(time.time() - self.started, 3),
+                'values': {
+                    name + format_labels(labels): round(value, 6)
+                    for (name, labels), value in sorted(self.values.items())
+                },
+                'histograms': {
+                    name + format_labels(labels): {
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 6),
+                        'mean': round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                        'max': round(histogram.max, 6),
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                },
+                'channels': list(self.channels),
+            }
+    
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info(f"Wrote run report to {path}")
+    
+    def serve(self, port, host='127.0.0.1'):
+        """Expose /metrics over HTTP from a daemon thread"""
+        metrics = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+    
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
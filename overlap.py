@@ -0,0 +1,133 @@
+import logging
+import os
+from array import array
+from itertools import chain
+
+logger = logging.getLogger(__name__)
+
+def import_numpy():
+    """numpy and scipy.sparse, imported only when overlap analytics are used"""
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        raise RuntimeError("Overlap analytics need numpy and scipy: pip install numpy scipy")
+    return numpy, sparse
+
+class OverlapMatrix:
+    """Sparse user x channel membership matrix built from one pass over user_channel
+    
+    Rows are users and columns channels, both sorted by id. Channel overlap
+    is the matrix product M.T @ M, whose diagonal holds channel sizes and
+    whose off-diagonal entries are shared members, so every pair is counted
+    at once instead of by a self-join per pair. Row lengths give how many
+    channels each user is in.
+    
+    The matrix is cached as an .npz file together with a signature of the
+    tables, and rebuilt when the signature no longer matches.
+    """
+    
+    def __init__(self, user_ids, channel_ids, matrix, signature=''):
+        self.user_ids = user_ids
+        self.channel_ids = channel_ids
+        self.matrix = matrix
+        self.signature = signature
+    
+    @classmethod
+    def build(cls, storage):
+        """Stream every user_channel link into a CSR matrix"""
+        np, sparse = import_numpy()
+        signature = storage.membership_signature()
+        
+        # Flattened (user_id, channel_id) pairs, filled at C speed without a tuple per link kept
+        pairs = array('q')
+        pairs.extend(chain.from_iterable(storage.stream_memberships()))
+        pairs = np.frombuffer(pairs, dtype=np.int64).reshape(-1, 2)
+        
+        user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        channel_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), (rows, columns)),
+            shape=(len(user_ids), len(channel_ids))
+        )
+        logger.info(f"Built {len(user_ids)} x {len(channel_ids)} membership matrix from {len(pairs)} links")
+        return cls(user_ids, channel_ids, matrix, signature)
+    
+    @classmethod
+    def load(cls, path):
+        np, sparse = import_numpy()
+        with np.load(path) as data:
+            user_ids = data['user_ids']
+            channel_ids = data['channel_ids']
+            indices = data['indices']
+            matrix = sparse.csr_matrix(
+                (np.ones(len(indices), dtype=np.int32), indices, data['indptr']),
+                shape=(len(user_ids), len(channel_ids))
+            )
+            return cls(user_ids, channel_ids, matrix, str(data['signature']))
+    
+    @classmethod
+    def cached(cls, storage, path, refresh=False):
+        """The matrix cached at path, rebuilt first if the tables changed since it was saved"""
+        if not refresh and os.path.exists(path):
+            matrix = cls.load(path)
+            if matrix.signature == storage.membership_signature():
+                return matrix
+            logger.info(f"Memberships changed since {path} was saved, rebuilding it")
+        
+        matrix = cls.build(storage)
+        matrix.save(path)
+        return matrix
+    
+    def save(self, path):
+        np, _ = import_numpy()
+        # Written beside the target and renamed, so a reader never sees half a file
+        temporary = path + '.tmp.npz'
+        np.savez_compressed(
+            temporary,
+            user_ids=self.user_ids,
+            channel_ids=self.channel_ids,
+            indptr=self.matrix.indptr,
+            indices=self.matrix.indices,
+            signature=self.signature
+        )
+        os.replace(temporary, path)
+    
+    def channel_sizes(self):
+        np, _ = import_numpy()
+        return np.bincount(self.matrix.indices, minlength=len(self.channel_ids))
+    
+    def top_pairs(self, limit=20, by='shared'):
+        """[(channel_id, channel_id, shared members, Jaccard similarity)] for the most overlapping pairs"""
+        np, sparse = import_numpy()
+        sizes = self.channel_sizes()
+        
+        # Upper triangle without the diagonal: each pair once
+        shared = sparse.triu(self.matrix.T @ self.matrix, k=1).tocoo()
+        jaccard = shared.data / (sizes[shared.row] + sizes[shared.col] - shared.data)
+        
+        key = shared.data if by == 'shared' else jaccard
+        order = np.argsort(-key, kind='stable')[:limit]
+        return [
+            (int(self.channel_ids[shared.row[i]]), int(self.channel_ids[shared.col[i]]),
+             int(shared.data[i]), float(jaccard[i]))
+            for i in order
+        ]
+    
+    def channels_per_user(self):
+        np, _ = import_numpy()
+        return np.diff(self.matrix.indptr)
+    
+    def multiplicity(self):
+        """[(channel count, users in exactly that many channels)], for counts that occur"""
+        np, _ = import_numpy()
+        histogram = np.bincount(self.channels_per_user())
+        return [(count, int(users)) for count, users in enumerate(histogram) if count and users]
+    
+    def users_in_at_least(self, min_channels, limit=None):
+        """Ids of users in min_channels or more channels, most channels first, and how many there are"""
+        np, _ = import_numpy()
+        counts = self.channels_per_user()
+        selected = np.flatnonzero(counts >= min_channels)
+        selected = selected[np.argsort(-counts[selected], kind='stable')]
+        return [int(user_id) for user_id in self.user_ids[selected[:limit]]], len(selected)
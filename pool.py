@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    """Thread-safe pool of database connections, health-checked on checkout
+    
+    A Storage and its copies share one pool, so the scraper's main and
+    writer connections (and the viewer's) come from the same place, are
+    reused instead of reopened, and are pinged before reuse when they have
+    been idle long enough for the server or a NAT to have dropped them.
+    """
+    
+    def __init__(self, open_connection, ping, max_size=4, max_idle=2, ping_after=30.0):
+        self.open_connection = open_connection
+        self.ping = ping
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.idle = []
+        self.in_use = 0
+        self.condition = threading.Condition()
+    
+    def acquire(self, timeout=None):
+        """Check out a live connection, opening one if none is idle"""
+        with self.condition:
+            while not self.idle and self.in_use >= self.max_size:
+                if not self.condition.wait(timeout):
+                    raise TimeoutError(f"No database connection free after {timeout}s")
+            
+            idle = self.idle.pop() if self.idle else None
+            self.in_use += 1
+        
+        try:
+            if idle:
+                connection, released_at = idle
+                if time.monotonic() - released_at < self.ping_after or self.is_alive(connection):
+                    return connection
+            return self.open_connection()
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+    
+    def is_alive(self, connection):
+        try:
+            self.ping(connection)
+            return True
+        except Exception as e:
+            logger.info(f"Dropping stale database connection ({e})")
+            self.discard(connection)
+            return False
+    
+    def release(self, connection, broken=False):
+        """Return a connection; broken ones and those over max_idle are closed"""
+        with self.condition:
+            self.in_use -= 1
+            keep = not broken and len(self.idle) < self.max_idle
+            if keep:
+                self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+        
+        if not keep:
+            self.discard(connection)
+    
+    @staticmethod
+    def discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+    
+    def close(self):
+        """Close every idle connection"""
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection)
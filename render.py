@@ -0,0 +1,166 @@
+import json
+import sys
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+# key names the field in machine-readable output; display formats it for the grid
+Column = namedtuple('Column', ('key', 'header', 'display'), defaults=(None,))
+
+def or_na(value):
+    return value if value else "N/A"
+
+def handle(value):
+    return f"@{value}" if value else "N/A"
+
+def yes_no(value):
+    return "Yes" if value else "No"
+
+def minutes(value):
+    return value.strftime("%Y-%m-%d %H:%M") if value else "N/A"
+
+def is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+def plain(value):
+    """Cell value for TSV and JSON Lines output"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+class GridRenderer:
+    """Grid tables in the style of tabulate's "grid", printed while rows are still arriving
+    
+    tabulate measures every cell before printing anything. Here column
+    widths come from the headers and the first sample_rows rows only, so
+    the table starts after that many rows and memory stays flat; later
+    cells longer than their column are cut short. With sample_rows=0
+    every column is max_width wide and rows print as soon as they arrive.
+    """
+    
+    machine = False
+    
+    def __init__(self, out=None, sample_rows=100, max_width=40):
+        self.out = out or sys.stdout
+        self.sample_rows = sample_rows
+        self.max_width = max_width
+    
+    def note(self, text):
+        print(text, file=self.out)
+    
+    def cells(self, columns, row):
+        return [
+            '' if value is None and column.display is None else str(column.display(value) if column.display else value)
+            for column, value in zip(columns, row)
+        ]
+    
+    def fit(self, text, width):
+        return text if len(text) <= width else text[:max(width - 3, 0)] + '...'
+    
+    def table(self, columns, rows):
+        """Print rows under columns' headers; returns how many rows were printed"""
+        rows = iter(rows)
+        sample = list(islice(rows, self.sample_rows))
+        sample_cells = [self.cells(columns, row) for row in sample]
+        
+        if self.sample_rows:
+            widths = [
+                min(max([len(column.header)] + [len(cells[i]) for cells in sample_cells]), self.max_width)
+                for i, column in enumerate(columns)
+            ]
+        else:
+            widths = [max(len(column.header), self.max_width) for column in columns]
+        # Numbers are right-aligned, as tabulate does
+        numeric = [
+            bool(sample_cells) and all(is_number(cells[i]) for cells in sample_cells if cells[i])
+            for i in range(len(columns))
+        ]
+        
+        def line(fill):
+            return '+' + '+'.join(fill * (width + 2) for width in widths) + '+'
+        
+        def format_row(cells):
+            return '| ' + ' | '.join(
+                self.fit(cell, width).rjust(width) if right else self.fit(cell, width).ljust(width)
+                for cell, width, right in zip(cells, widths, numeric)
+            ) + ' |'
+        
+        separator = line('-')
+        write = self.out.write
+        write(separator + '\n')
+        write(format_row([column.header for column in columns]) + '\n')
+        write(line('=') + '\n')
+        
+        count = 0
+        for cells in sample_cells:
+            write(format_row(cells) + '\n' + separator + '\n')
+            count += 1
+        for row in rows:
+            write(format_row(self.cells(columns, row)) + '\n' + separator + '\n')
+            count += 1
+        self.out.flush()
+        return count
+
+class TSVRenderer:
+    """Header line and one tab-separated line per row, for cut/awk/sort and spreadsheets"""
+    
+    machine = True
+    # Tabs and newlines inside values are escaped so every row stays on one line
+    ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+    
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+    
+    def note(self, text):
+        # Titles and hints go to stderr so piped output holds only the data
+        print(text, file=sys.stderr)
+    
+    def field(self, value):
+        value = plain(value)
+        return '' if value is None else str(value).translate(self.ESCAPES)
+    
+    def table(self, columns, rows):
+        write = self.out.write
+        write('\t'.join(column.key for column in columns) + '\n')
+        count = 0
+        for row in rows:
+            write('\t'.join(map(self.field, row)) + '\n')
+            count += 1
+        self.out.flush()
+        return count
+
+class JSONLinesRenderer:
+    """One JSON object per row keyed by column key, for jq and loaders"""
+    
+    machine = True
+    
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+    
+    def note(self, text):
+        print(text, file=sys.stderr)
+    
+    def table(self, columns, rows):
+        keys = [column.key for column in columns]
+        write = self.out.write
+        count = 0
+        for row in rows:
+            write(json.dumps(dict(zip(keys, map(plain, row))), ensure_ascii=False) + '\n')
+            count += 1
+        self.out.flush()
+        return count
+
+RENDERERS = {
+    'grid': GridRenderer,
+    'tsv': TSVRenderer,
+    'jsonl': JSONLinesRenderer,
+}
+
+def create_renderer(output='grid', sample_rows=100, max_width=40):
+    if output == 'grid':
+        return GridRenderer(sample_rows=sample_rows, max_width=max_width)
+    return RENDERERS[output]()
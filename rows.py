@@ -0,0 +1,95 @@
+from collections import namedtuple
+from functools import partial
+from operator import attrgetter
+
+# Compact records holding only the fields we store. Telethon objects are
+# converted as soon as a page arrives so the full TL objects can be freed.
+UserRow = namedtuple('UserRow', (
+    'id', 'access_hash', 'username', 'first_name', 'last_name', 'phone',
+    'is_bot', 'is_verified', 'is_restricted', 'is_scam', 'is_fake'
+))
+
+ChannelRow = namedtuple('ChannelRow', (
+    'id', 'access_hash', 'title', 'username', 'participants_count', 'is_megagroup', 'is_broadcast'
+))
+
+class RowMapper:
+    """Converts Telethon objects into rows with attribute getters built once
+    
+    Full User and Channel objects carry every attribute, so a whole page is
+    converted by one attrgetter and tuple construction per object, all in C.
+    Objects missing attributes (UserEmpty, ChannelForbidden, ...) fall back
+    to a getter built once per class that fills in the defaults.
+    """
+    
+    def __init__(self, row_type, attributes, defaults):
+        self.row_type = row_type
+        self.attributes = attributes
+        self.defaults = defaults
+        self.get_all = attrgetter(*attributes)
+        # tuple.__new__ skips namedtuple's Python-level constructor
+        self.make = partial(tuple.__new__, row_type)
+        self.fallbacks = {}
+    
+    def rows(self, objects):
+        """Rows for a list of objects"""
+        try:
+            return list(map(self.make, map(self.get_all, objects)))
+        except AttributeError:
+            return [self.row(obj) for obj in objects]
+    
+    def row(self, obj):
+        """Row for a single object of any class"""
+        getter = self.fallbacks.get(type(obj))
+        if getter is None:
+            getter = self.fallbacks[type(obj)] = self.fallback_getter(obj)
+        return self.make(getter(obj))
+    
+    def fallback_getter(self, obj):
+        if all(hasattr(obj, name) for name in self.attributes):
+            return self.get_all
+        
+        pairs = tuple(zip(self.attributes, self.defaults))
+        return lambda obj: tuple(getattr(obj, name, default) for name, default in pairs)
+
+users = RowMapper(
+    UserRow,
+    ('id', 'access_hash', 'username', 'first_name', 'last_name', 'phone',
+     'bot', 'verified', 'restricted', 'scam', 'fake'),
+    (None, None, None, None, None, None, False, False, False, False, False)
+)
+
+channels = RowMapper(
+    ChannelRow,
+    ('id', 'access_hash', 'title', 'username', 'participants_count', 'megagroup', 'broadcast'),
+    (None, None, None, None, None, False, False)
+)
+
+def user_row(user):
+    """Build a UserRow from a Telethon user"""
+    return users.row(user)
+
+def user_rows(page):
+    """UserRows for a page of Telethon users, with their change fingerprints"""
+    rows = users.rows(page)
+    return rows, fingerprints(rows)
+
+def fingerprints(rows):
+    """Change fingerprints of rows, as compared by UserCache"""
+    return list(map(hash, rows))
+
+def summary_flags(row):
+    """Bits of a UserRow counted in summary_stats: username set, bot, verified"""
+    return (row.username is not None) | bool(row.is_bot) << 1 | bool(row.is_verified) << 2
+
+def channel_row(channel):
+    """Build a ChannelRow from a Telethon channel"""
+    return channels.row(channel)
+
+def parse_channel_id(name):
+    """Channel id named by a plain or Bot API style id, or None when name is not an id"""
+    name = name.strip()
+    # Bot API style ids carry a -100 prefix
+    if name.startswith('-100') and name[4:].isdigit():
+        return int(name[4:])
+    return int(name) if name.isdigit() else None
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import math
+
+from telethon.tl.types import Channel
+
+from rows import parse_channel_id
+
+logger = logging.getLogger(__name__)
+
+ORDERS = ('stale', 'small', 'large', 'dialog')
+
+def channel_names(channel):
+    """Ways a channel can be named in --include/--exclude: id, username, title"""
+    names = {str(channel.id), channel.title.lower()}
+    if getattr(channel, 'username', None):
+        names.add(channel.username.lower())
+    return names
+
+def normalize_name(name):
+    name = name.strip().lower().lstrip('@')
+    channel_id = parse_channel_id(name)
+    return name if channel_id is None else str(channel_id)
+
+class ChannelScheduler:
+    """Orders channels for scraping while the dialog list is still streaming in
+    
+    Dialogs are read lazily and only channels and supergroups are kept, so
+    scraping starts as soon as the first eligible one arrives. Each time a
+    channel finishes, the best one discovered so far is picked next:
+    
+    - stale: never scraped first, then the longest since scraped_at
+    - small / large: by member count, known from the dialog or the last scrape
+    - dialog: the order Telegram returns dialogs in (most recent activity)
+    
+    Channels named in include always come first, in the order given; when
+    include is set nothing else is scraped, and when it names nothing but
+    ids the dialogs are not listed at all. Channels named in exclude are
+    skipped.
+    """
+    
+    def __init__(self, order='stale', include=(), exclude=()):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown channel order: {order}")
+        self.order = order
+        self.include = [normalize_name(name) for name in include]
+        self.exclude = {normalize_name(name) for name in exclude}
+        self.channel_state = {}
+        self.discovered = 0
+    
+    def eligible(self, entity):
+        """Channels and supergroups we may scrape; private chats and basic groups are dropped"""
+        if not isinstance(entity, Channel):
+            return False
+        
+        names = channel_names(entity)
+        if names & self.exclude:
+            return False
+        return not self.include or bool(names.intersection(self.include))
+    
+    def included_ids(self):
+        """The channel ids named in include, or None unless every name is an id"""
+        channel_ids = [parse_channel_id(name) for name in self.include]
+        return channel_ids if channel_ids and None not in channel_ids else None
+    
+    def priority(self, entity, position):
+        """Sort key for a channel, lowest first"""
+        names = channel_names(entity)
+        rank = min((index for index, name in enumerate(self.include) if name in names), default=len(self.include))
+        
+        participants_count, age_seconds = self.channel_state.get(entity.id, (None, None))
+        if self.order == 'stale':
+            key = -(age_seconds if age_seconds is not None else math.inf)
+        elif self.order in ('small', 'large'):
+            size = getattr(entity, 'participants_count', None) or participants_count
+            if size is None:
+                # Unknown sizes go after the known ones
+                key = math.inf
+            else:
+                key = size if self.order == 'small' else -size
+        else:
+            key = position
+        
+        return rank, key, position
+    
+    async def dialogs(self, client, throttle, page_size=100):
+        """Dialogs a page at a time, each page requested through the throttle"""
+        offsets = {}
+        while True:
+            page = await throttle.call(client.get_dialogs, page_size, **offsets)
+            for dialog in page:
+                yield dialog
+            
+            # The next page starts after the last dialog with a message, as Telethon pages them
+            last = next((dialog for dialog in reversed(page) if dialog.message is not None), None)
+            if len(page) < page_size or last is None:
+                return
+            offsets = dict(offset_date=last.date, offset_id=last.message.id, offset_peer=last.input_entity)
+    
+    async def feed(self, client, queue, throttle):
+        """Stream dialogs into queue; the throttle paces each page and retries flood waits and errors"""
+        seen = set()
+        async for dialog in self.dialogs(client, throttle):
+            entity = dialog.entity
+            if entity.id in seen or not self.eligible(entity):
+                continue
+            
+            seen.add(entity.id)
+            self.discovered += 1
+            queue.put_nowait((self.priority(entity, self.discovered), entity))
+    
+    async def channels(self, client, throttle, channel_state=None, entities=None):
+        """Yield channels to scrape, best first among those discovered so far
+        
+        Given the run's EntityCache, channels included by id are addressed
+        with their stored access hashes instead of listing every dialog.
+        """
+        self.channel_state = channel_state or {}
+        self.discovered = 0
+        
+        channel_ids = self.included_ids() if entities is not None else None
+        if channel_ids:
+            for entity in await entities.resolve_ids(client, throttle, channel_ids):
+                if self.eligible(entity):
+                    self.discovered += 1
+                    yield entity
+            return
+        
+        queue = asyncio.PriorityQueue()
+        feeder = asyncio.create_task(self.feed(client, queue, throttle))
+        
+        try:
+            while True:
+                if queue.empty():
+                    # Wait for the next channel or for the listing to end
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({getter, feeder}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        if queue.empty():
+                            break
+                        continue
+                    _, entity = getter.result()
+                else:
+                    _, entity = queue.get_nowait()
+                
+                yield entity
+            
+            # Surface a failed listing once everything it found has been scraped
+            feeder.result()
+        finally:
+            if not feeder.done():
+                feeder.cancel()
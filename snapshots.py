@@ -0,0 +1,319 @@
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from itertools import chain
+
+from render import RENDERERS, Column, create_renderer
+from rows import parse_channel_id
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TGSNAP1\n'
+# magic, channel id, taken at (epoch seconds), members, id groups, title bytes
+HEADER = struct.Struct('<8sqqQII')
+# high 32 bits of the group's ids, index of its first member
+GROUP = struct.Struct('<IQ')
+# Snapshot file names sort by time, to the millisecond: 20261017T042314_123.ids
+STAMP = '%Y%m%dT%H%M%S'
+SUFFIX = '.ids'
+
+def padding(size, alignment=8):
+    return -size % alignment
+
+def group_ids(ids):
+    """[(high, start)] for sorted ids, one entry per distinct high 32 bits"""
+    groups = []
+    start = 0
+    while start < len(ids):
+        high = ids[start] >> 32
+        groups.append((high, start))
+        start = bisect_left(ids, (high + 1) << 32, start)
+    return groups
+
+def import_numpy():
+    """numpy, imported only when snapshots are combined"""
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Snapshot set operations need numpy: pip install numpy")
+    return numpy
+
+class Snapshot:
+    """One channel's member ids at one point in time, read from a memory-mapped file
+    
+    Ids are split by their high 32 bits, as Roaring bitmaps do: a small
+    group table holds each distinct high half with the index of its first
+    member, and the low halves follow as sorted uint32s, 4 bytes a member.
+    Counts come from the header, lookups bisect the mapped low halves, and
+    nothing is decoded until the ids are asked for.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, self.channel_id, self.taken_at, self.count, groups, title_size = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a membership snapshot")
+        
+        offset = HEADER.size
+        self.title = self.map[offset:offset + title_size].decode('utf-8')
+        offset += title_size + padding(title_size)
+        self.groups = [GROUP.unpack_from(self.map, offset + i * GROUP.size) for i in range(groups)]
+        offset += groups * GROUP.size
+        
+        self.lows = memoryview(self.map)[offset:offset + self.count * 4]
+        if sys.byteorder == 'little':
+            self.lows = self.lows.cast('I')
+        else:
+            self.lows = array('I', self.lows)
+            self.lows.byteswap()
+    
+    def __len__(self):
+        return self.count
+    
+    def __contains__(self, user_id):
+        index = bisect_left(self.groups, (user_id >> 32,))
+        if index == len(self.groups) or self.groups[index][0] != user_id >> 32:
+            return False
+        lows = self.group_lows(index)
+        position = bisect_left(lows, user_id & 0xFFFFFFFF)
+        return position < len(lows) and lows[position] == user_id & 0xFFFFFFFF
+    
+    def group_lows(self, index, lows=None):
+        """The low halves of one group, sliced from lows (the mapped ones by default)"""
+        lows = self.lows if lows is None else lows
+        start = self.groups[index][1]
+        end = self.groups[index + 1][1] if index + 1 < len(self.groups) else self.count
+        return lows[start:end]
+    
+    def ids(self):
+        """Every member id as a sorted int64 numpy array"""
+        np = import_numpy()
+        lows = np.frombuffer(self.lows, dtype=np.uint32)
+        return np.concatenate([
+            self.group_lows(index, lows).astype(np.int64) + (high << 32)
+            for index, (high, _) in enumerate(self.groups)
+        ] or [np.empty(0, dtype=np.int64)])
+    
+    def close(self):
+        # Views into the map must go before it can be closed
+        self.lows = None
+        self.map.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def diff(old, new):
+    """(joined, left): sorted ids only in new, and only in old"""
+    np = import_numpy()
+    old_ids, new_ids = old.ids(), new.ids()
+    return np.setdiff1d(new_ids, old_ids, assume_unique=True), np.setdiff1d(old_ids, new_ids, assume_unique=True)
+
+def union(snapshots):
+    """Sorted ids in any of the snapshots"""
+    np = import_numpy()
+    # Each snapshot is already a sorted run, which a stable (merge) sort only has to merge
+    ids = np.sort(np.concatenate([snapshot.ids() for snapshot in snapshots]), kind='stable')
+    return ids[np.concatenate(([True], ids[1:] != ids[:-1]))] if len(ids) else ids
+
+def intersection(snapshots):
+    """Sorted ids in every one of the snapshots"""
+    np = import_numpy()
+    # Smallest first, so the working set only shrinks
+    snapshots = sorted(snapshots, key=len)
+    ids = snapshots[0].ids()
+    for snapshot in snapshots[1:]:
+        ids = np.intersect1d(ids, snapshot.ids(), assume_unique=True)
+    return ids
+
+class SnapshotStore:
+    """Per-channel membership snapshots under directory/<channel id>/<time>.ids
+    
+    The scraper saves one after every complete listing of a channel, so
+    memberships can be compared across runs without the database.
+    """
+    
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+    
+    def save_snapshot(self, channel_id, ids, title='', taken_at=None):
+        """Write sorted, distinct ids (as idsets.sorted_ids gives) as a new snapshot of the channel; returns its path"""
+        taken_at = time.time() if taken_at is None else taken_at
+        groups = group_ids(ids)
+        title = (title or '').encode('utf-8')
+        
+        lows = array('I', map((0xFFFFFFFF).__and__, ids))
+        if sys.byteorder != 'little':
+            lows.byteswap()
+        
+        channel_dir = os.path.join(self.directory, str(channel_id))
+        os.makedirs(channel_dir, exist_ok=True)
+        
+        # Written beside the target and linked into place, so a reader never maps half a file
+        temporary = os.path.join(channel_dir, f'.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, channel_id, int(taken_at), len(ids), len(groups), len(title)))
+            f.write(title + b'\0' * padding(len(title)))
+            for group in groups:
+                f.write(GROUP.pack(*group))
+            lows.tofile(f)
+        
+        # Unlike a rename, a link never replaces an existing snapshot; a taken name moves on a millisecond
+        millis = int(taken_at * 1000)
+        while True:
+            stamp = time.strftime(STAMP, time.gmtime(millis // 1000))
+            path = os.path.join(channel_dir, f'{stamp}_{millis % 1000:03d}{SUFFIX}')
+            try:
+                os.link(temporary, path)
+                break
+            except FileExistsError:
+                millis += 1
+        os.remove(temporary)
+        
+        logger.info(f"Saved snapshot of {len(ids)} members of channel {channel_id} ({os.path.getsize(path)} bytes)")
+        return path
+    
+    def channel_ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name) for name in os.listdir(self.directory) if name.lstrip('-').isdigit())
+    
+    def paths(self, channel_id, before=None):
+        """A channel's snapshot files, oldest first, optionally only those taken before a stamp
+        
+        before is compared with the file names, so a prefix such as 20261018
+        means "before 18 October 2026" (UTC).
+        """
+        channel_dir = os.path.join(self.directory, str(channel_id))
+        if not os.path.isdir(channel_dir):
+            return []
+        names = sorted(name for name in os.listdir(channel_dir) if name.endswith(SUFFIX))
+        if before is not None:
+            names = [name for name in names if name[:-len(SUFFIX)] < before]
+        return [os.path.join(channel_dir, name) for name in names]
+    
+    def latest(self, channel_id, before=None, count=1):
+        """The newest count snapshots of a channel, oldest of them first"""
+        return [Snapshot(path) for path in self.paths(channel_id, before)[-count:]]
+    
+    def find(self, name):
+        """Channel id for an id or part of a title, as the latest snapshots record it"""
+        channel_ids = self.channel_ids()
+        if parse_channel_id(name) in channel_ids:
+            return parse_channel_id(name)
+        
+        name = name.lower()
+        for channel_id in channel_ids:
+            with Snapshot(self.paths(channel_id)[-1]) as snapshot:
+                if name in snapshot.title.lower():
+                    return channel_id
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare membership snapshots saved by the scraper, without the database')
+    parser.add_argument('--dir', type=str, default='snapshots', help='Snapshot directory (default: snapshots)')
+    parser.add_argument('--list', action='store_true', help='List channels and their snapshots')
+    parser.add_argument('--diff', type=str, metavar='CHANNEL',
+                        help='Users who joined and left a channel between its two latest snapshots')
+    parser.add_argument('--union', nargs='+', metavar='CHANNEL', help='Users in any of the channels')
+    parser.add_argument('--intersect', nargs='+', metavar='CHANNEL', help='Users in every one of the channels')
+    parser.add_argument('--before', type=str, metavar='STAMP',
+                        help='Use snapshots taken before this UTC time, e.g. 20261018 or 20261017T1200')
+    parser.add_argument('--ids', action='store_true', help='Print the user ids, not only the counts')
+    parser.add_argument('--output', choices=sorted(RENDERERS), default='grid',
+                        help='Print tables as a grid, tab-separated values or JSON Lines (default: grid)')
+    args = parser.parse_args()
+    
+    store = SnapshotStore(args.dir)
+    renderer = create_renderer(args.output)
+    
+    def resolve(names, count=1):
+        snapshots = []
+        for name in names:
+            channel_id = store.find(name)
+            if channel_id is None:
+                parser.error(f"No snapshots of channel '{name}' in {store.directory}")
+            found = store.latest(channel_id, args.before, count)
+            if len(found) < count:
+                parser.error(f"Channel '{name}' needs {count} snapshots, found {len(found)}")
+            snapshots.extend(found)
+        return snapshots
+    
+    snapshot_columns = [
+        Column('channel_id', "Channel ID"),
+        Column('title', "Title"),
+        Column('taken_at', "Taken At (UTC)", lambda taken_at: taken_at.strftime("%Y-%m-%d %H:%M:%S")),
+        Column('members', "Members"),
+    ]
+    
+    def describe(snapshot):
+        taken_at = datetime.fromtimestamp(snapshot.taken_at, timezone.utc).replace(tzinfo=None)
+        return snapshot.channel_id, snapshot.title, taken_at, len(snapshot)
+    
+    if args.list or not any([args.diff, args.union, args.intersect]):
+        rows = []
+        for channel_id in store.channel_ids():
+            for path in store.paths(channel_id, args.before):
+                with Snapshot(path) as snapshot:
+                    rows.append(describe(snapshot) + (os.path.getsize(path),))
+        renderer.note(f"\n=== SNAPSHOTS IN {store.directory} ===")
+        renderer.table(snapshot_columns + [Column('bytes', "Bytes")], rows)
+    
+    # With --ids, TSV and JSON Lines carry only the ids so they can be piped on
+    summaries = not (args.ids and renderer.machine)
+    
+    try:
+        if args.diff:
+            old, new = resolve([args.diff], count=2)
+            started = time.perf_counter()
+            joined, left = diff(old, new)
+            elapsed = time.perf_counter() - started
+            
+            renderer.note(f"\n=== CHANGES IN '{new.title}' ({elapsed:.3f}s) ===")
+            if summaries:
+                renderer.table(snapshot_columns, [describe(old), describe(new)])
+                renderer.table([Column('change', "Change"), Column('users', "Users")],
+                               [('joined', len(joined)), ('left', len(left))])
+            if args.ids:
+                renderer.table([Column('user_id', "User ID"), Column('change', "Change")], chain(
+                    ((user_id, 'joined') for user_id in joined.tolist()),
+                    ((user_id, 'left') for user_id in left.tolist())
+                ))
+        
+        for names, operation, title in ((args.union, union, "IN ANY"), (args.intersect, intersection, "IN ALL")):
+            if not names:
+                continue
+            snapshots = resolve(names)
+            started = time.perf_counter()
+            ids = operation(snapshots)
+            elapsed = time.perf_counter() - started
+            
+            renderer.note(f"\n=== USERS {title} OF {len(snapshots)} CHANNELS: {len(ids)} ({elapsed:.3f}s) ===")
+            if summaries:
+                renderer.table(snapshot_columns, map(describe, snapshots))
+            if args.ids:
+                renderer.table([Column('user_id', "User ID")], ((user_id,) for user_id in ids.tolist()))
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except BrokenPipeError:
+        # Output piped into head or less that exited early; silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
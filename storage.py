@@ -0,0 +1,1455 @@
+import copy
+import logging
+import sqlite3
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+
+from bulkload import read_staged
+from pool import ConnectionPool
+from rows import UserRow, parse_channel_id, summary_flags
+
+logger = logging.getLogger(__name__)
+
+USER_COLUMNS = (
+    'id', 'access_hash', 'username', 'first_name', 'last_name',
+    'phone', 'is_bot', 'is_verified', 'is_restricted', 'is_scam', 'is_fake'
+)
+
+CHANNEL_COLUMNS = (
+    'id', 'access_hash', 'title', 'username',
+    'participants_count', 'is_megagroup', 'is_broadcast'
+)
+
+# users fields whose changes are logged with --track-changes
+TRACKED_USER_FIELDS = (
+    'username', 'first_name', 'last_name', 'phone',
+    'is_bot', 'is_verified', 'is_restricted', 'is_scam', 'is_fake'
+)
+
+# Version 1 is the original schema, before schema_version existed
+SCHEMA_VERSION = 2
+
+# Tables rebuilt by the version 2 migration: table -> (columns copied, key of the old table)
+V2_COPIED_TABLES = {
+    'users': (USER_COLUMNS + ('created_at',), 'id'),
+    'channels': (CHANNEL_COLUMNS + ('scraped_at',), 'id'),
+    'user_channel': (('user_id', 'channel_id', 'scraped_at'), 'id'),
+}
+
+# Tables filled from bulk-load segments: table -> (columns, upsert keys or None to only add, extra updates)
+STAGED_TABLES = {
+    'users': (USER_COLUMNS, ('id',), ()),
+    'channels': (CHANNEL_COLUMNS, ('id',), ('scraped_at = CURRENT_TIMESTAMP',)),
+    'user_channel': (('user_id', 'channel_id'), None, ()),
+    'participant_pages': (('channel_id', 'page_offset', 'page_hash', 'page_size'), ('channel_id', 'page_offset'), ()),
+    'scrape_checkpoints': (('channel_id', 'last_offset', 'completed'), ('channel_id',),
+                           ('updated_at = CURRENT_TIMESTAMP',)),
+}
+
+SUMMARY_KEYS = (
+    'total_users', 'total_channels', 'total_relationships',
+    'users_with_username', 'bot_count', 'verified_count'
+)
+
+# Row triggers that maintained summary_stats before the writers applied per-transaction deltas
+LEGACY_SUMMARY_TRIGGERS = (
+    'summary_users_insert', 'summary_users_update', 'summary_users_delete',
+    'summary_channels_insert', 'summary_channels_delete',
+    'summary_links_insert', 'summary_links_delete',
+)
+
+def like_escape(text):
+    """Escape LIKE wildcards in user input, using ! as the escape character"""
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+class Storage:
+    """Database backend shared by TelegramScraper and DataViewer
+    
+    Subclasses open the connection, create the schema and supply the few SQL
+    fragments that differ between engines. Everything else is written once
+    here with %s placeholders. Methods that write never commit; callers decide
+    the transaction boundaries, usually through transaction() so a batch
+    survives a dropped connection.
+    
+    Connections come from a pool shared with copy()'d storages. Each
+    connection keeps one cursor that every statement reuses.
+    """
+    
+    name = None
+    placeholder = '%s'
+    # Appended to username comparisons so they are case-insensitive and can use the index
+    nocase = ''
+    # CREATE TABLE statements of the current schema, with {name} so migrations can build a copy
+    tables = {}
+    # Indexes created separately from their tables
+    indexes = ()
+    
+    def __init__(self, connect_timeout=10, query_timeout=300, retries=3):
+        self.connect_timeout = connect_timeout
+        self.query_timeout = query_timeout
+        self.retries = retries
+        self.pool = None
+        self.connection = None
+        self.cursor = None
+        # Placeholder-adapted SQL text, so repeated statements are only rewritten once
+        self.statements = {}
+        # summary_stats changes made by the open transaction, applied just before it commits
+        self.summary_deltas = {}
+    
+    def copy(self):
+        """Unconnected storage with the same settings and pool, for use on another thread"""
+        other = copy.copy(self)
+        other.connection = None
+        other.cursor = None
+        other.summary_deltas = {}
+        return other
+    
+    def connect(self):
+        """Check out a connection from the pool shared with this storage's copies"""
+        if self.pool is None:
+            self.pool = ConnectionPool(self.open_connection, self.ping)
+        self.connection = self.pool.acquire(self.query_timeout)
+        self.cursor = self.connection.cursor()
+    
+    def open_connection(self):
+        raise NotImplementedError
+    
+    def ping(self, connection):
+        """Raise if connection is no longer usable"""
+        raise NotImplementedError
+    
+    def is_transient(self, error):
+        """Whether error means the transaction was lost and can simply be run again"""
+        return False
+    
+    def transaction(self, operation, *args):
+        """Run operation(*args) and commit, rerunning it on a new connection if the old one drops
+        
+        Writes are upserts and ignore-inserts, so running a whole batch again
+        after a lost connection (or a deadlock) is safe.
+        """
+        attempt = 0
+        while True:
+            try:
+                if self.connection is None:
+                    self.connect()
+                result = operation(*args)
+                self.commit()
+                return result
+            except Exception as e:
+                if not self.is_transient(e) or attempt >= self.retries:
+                    raise
+                
+                attempt += 1
+                logger.warning(f"Database connection lost or transaction aborted ({e}), "
+                               f"retrying {attempt}/{self.retries}")
+                self.drop_connection()
+                time.sleep(min(2 ** attempt, 30))
+    
+    def drop_connection(self):
+        """Discard a connection that can't be trusted any more"""
+        if self.connection:
+            self.pool.release(self.connection, broken=True)
+            self.connection = None
+            self.cursor = None
+        self.summary_deltas = {}
+    
+    def setup(self):
+        """Migrate to the current schema, then create missing tables and indexes and seed the summary"""
+        self.migrate()
+        self.create_tables()
+        self.setup_summary_stats()
+        self.commit()
+    
+    def create_tables(self):
+        for table, statement in self.tables.items():
+            self.execute(statement.format(name=table))
+        for statement in self.indexes:
+            self.execute(statement)
+        self.commit()
+    
+    def existing_triggers(self):
+        """Names of the triggers defined in the database"""
+        raise NotImplementedError
+    
+    def table_columns(self, table):
+        """Column names of a table, empty if it doesn't exist"""
+        raise NotImplementedError
+    
+    def has_search_index(self):
+        """Whether build_search_index has been run"""
+        raise NotImplementedError
+    
+    def swap_table(self, table, replacement):
+        """Replace table by replacement, dropping the old one"""
+        raise NotImplementedError
+    
+    # Schema migrations
+    
+    def schema_version(self):
+        """Schema version of the database; SCHEMA_VERSION for a new one"""
+        (version,) = self.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        if version is not None:
+            return version
+        
+        # Version 1 repeated the primary keys in users.user_id and channels.channel_id
+        if 'user_id' in self.table_columns('users'):
+            return 1
+        return SCHEMA_VERSION
+    
+    def migration_lock(self):
+        """Context manager held while migrating, so only one process migrates at a time"""
+        raise NotImplementedError
+    
+    def other_sessions(self):
+        """Other connections that could write to the tables while they are being copied"""
+        return 0
+    
+    def migrate(self):
+        """Apply migrate_to_vN for every version the database is behind
+        
+        Migrations run under migration_lock() and the version is read again
+        once it is held, so a second process that arrives mid-migration waits
+        and then finds the schema current. A migration refuses to start while
+        other clients are connected: rows they wrote to a table after it was
+        copied would be lost when the copy is swapped in.
+        """
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self.commit()
+        record = self.insert_ignore_sql('schema_version', ('version',))
+        
+        if self.schema_version() < SCHEMA_VERSION:
+            with self.migration_lock():
+                # A fresh read, not the snapshot taken before waiting for the lock
+                self.commit()
+                version = self.schema_version()
+                
+                sessions = self.other_sessions() if version < SCHEMA_VERSION else 0
+                if sessions:
+                    raise RuntimeError(f"The schema migration needs the database to itself, but {sessions} other "
+                                       f"connections are open; stop other scrapers and viewers and start again")
+                
+                for target in range(version + 1, SCHEMA_VERSION + 1):
+                    logger.info(f"Migrating database schema from version {target - 1} to {target}")
+                    getattr(self, f'migrate_to_v{target}')()
+                    self.execute(record, (target,))
+                    self.commit()
+        
+        self.execute(record, (SCHEMA_VERSION,))
+        self.commit()
+    
+    def migrate_to_v2(self):
+        """Drop the duplicated id columns and key user_channel by (user_id, channel_id)
+        
+        Each table is copied into its new layout in chunks, then swapped in by
+        rename. On MySQL every chunk is committed to keep transactions short;
+        no other client is connected, as migrate() refuses to start otherwise.
+        SQLite runs the whole migration in the write transaction of its
+        migration_lock(), which readers can still read past. The search index
+        goes away with the old tables and is rebuilt here.
+        """
+        search_index = self.has_search_index()
+        
+        for table, (columns, key) in V2_COPIED_TABLES.items():
+            replacement = f'{table}_v2'
+            # Left over from an interrupted migration
+            self.execute(f"DROP TABLE IF EXISTS {replacement}")
+            self.execute(self.tables[table].format(name=replacement))
+            self.copy_rows(table, replacement, columns, key)
+            self.swap_table(table, replacement)
+        
+        self.create_tables()
+        if search_index:
+            self.build_search_index()
+    
+    def copy_rows(self, source, target, columns, key, batch_size=50000):
+        """Copy columns from source to target in key ranges of batch_size rows, committing each"""
+        column_list = ', '.join(columns)
+        copied = 0
+        last_key = None
+        
+        while True:
+            where, params = ('', ()) if last_key is None else (f'WHERE {key} > %s', (last_key,))
+            (upper,) = self.execute(f"""
+                SELECT MAX({key}) FROM (
+                    SELECT {key} FROM {source} {where} ORDER BY {key} LIMIT %s
+                ) chunk
+            """, params + (batch_size,)).fetchone()
+            if upper is None:
+                break
+            
+            cursor = self.execute(f"""
+                INSERT INTO {target} ({column_list})
+                SELECT {column_list} FROM {source}
+                {where + ' AND' if where else 'WHERE'} {key} <= %s
+            """, params + (upper,))
+            self.commit()
+            
+            copied += cursor.rowcount
+            last_key = upper
+            logger.info(f"Copied {copied} rows from {source} to {target}")
+    
+    def close(self):
+        """Hand the connection back to the pool, without any open transaction"""
+        if self.connection:
+            try:
+                self.connection.rollback()
+                broken = False
+            except Exception:
+                broken = True
+            self.pool.release(self.connection, broken)
+            self.connection = None
+            self.cursor = None
+        self.summary_deltas = {}
+    
+    def close_pool(self):
+        """Close this storage's connection and every idle one in the pool"""
+        self.close()
+        if self.pool:
+            self.pool.close()
+    
+    def commit(self):
+        self.apply_summary_deltas()
+        self.connection.commit()
+    
+    def rollback(self):
+        self.summary_deltas = {}
+        # After a failed reconnect there is nothing to roll back
+        if self.connection:
+            self.connection.rollback()
+    
+    def sql(self, query):
+        """Adapt %s placeholders to the engine's parameter style"""
+        if self.placeholder == '%s':
+            return query
+        statement = self.statements.get(query)
+        if statement is None:
+            statement = self.statements[query] = query.replace('%s', self.placeholder)
+        return statement
+    
+    def execute(self, query, params=()):
+        """Run a statement on the connection's cursor; read its results before the next call"""
+        self.cursor.execute(self.sql(query), params)
+        return self.cursor
+    
+    def executemany(self, query, rows):
+        self.cursor.executemany(self.sql(query), rows)
+        return self.cursor
+    
+    def stream(self, query, params=()):
+        """Yield result rows as they arrive instead of buffering the whole result"""
+        # A cursor of its own, so other statements can run while this one is read
+        cursor = self.connection.cursor()
+        cursor.execute(self.sql(query), params)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+    
+    def upsert_sql(self, table, columns, keys, extra_updates=(), select=None):
+        """INSERT that updates every non-key column when the key already exists"""
+        raise NotImplementedError
+    
+    def insert_ignore_sql(self, table, columns, select=None):
+        """INSERT that silently skips rows whose key already exists"""
+        raise NotImplementedError
+    
+    def age_seconds_sql(self, column):
+        """Expression for the number of seconds since a timestamp column"""
+        raise NotImplementedError
+    
+    def values_sql(self, columns, select=None):
+        """Column list and a row of placeholders, or the rows of a SELECT instead"""
+        if select is not None:
+            return f"({', '.join(columns)}) {select}"
+        return f"({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    
+    # Scraper writes
+    
+    def upsert_users(self, rows, stored_flags=None):
+        """Insert or update a batch of UserRow records
+        
+        stored_flags maps users the user cache knows about to the summary
+        flags of their stored row, or None when they are not stored; only
+        the others are read back to count the summary deltas.
+        """
+        self.count_user_changes(rows, stored_flags)
+        self.executemany(self.upsert_sql('users', USER_COLUMNS, ('id',)), rows)
+    
+    def link_users(self, channel_id, user_ids):
+        """Record that users were seen in a channel"""
+        cursor = self.executemany(
+            self.insert_ignore_sql('user_channel', ('user_id', 'channel_id')),
+            [(user_id, channel_id) for user_id in user_ids]
+        )
+        # Only links that were not there yet count as inserted
+        self.add_to_summary(total_relationships=cursor.rowcount)
+    
+    def upsert_channel(self, row):
+        """Insert or update a ChannelRow and mark it as scraped now"""
+        if self.execute("SELECT 1 FROM channels WHERE id = %s", (row.id,)).fetchone() is None:
+            self.add_to_summary(total_channels=1)
+        self.execute(
+            self.upsert_sql('channels', CHANNEL_COLUMNS, ('id',), ('scraped_at = CURRENT_TIMESTAMP',)),
+            row
+        )
+    
+    def save_checkpoint(self, channel_id, offset, completed):
+        self.execute(
+            self.upsert_sql('scrape_checkpoints', ('channel_id', 'last_offset', 'completed'), ('channel_id',),
+                            ('updated_at = CURRENT_TIMESTAMP',)),
+            (channel_id, offset, completed)
+        )
+    
+    def reset_checkpoints(self):
+        """Forget every channel's progress, so a later --resume only trusts the run starting now"""
+        self.execute("UPDATE scrape_checkpoints SET last_offset = 0, completed = FALSE")
+    
+    def save_page_hash(self, channel_id, page_offset, page_hash, page_size):
+        self.execute(
+            self.upsert_sql('participant_pages', ('channel_id', 'page_offset', 'page_hash', 'page_size'),
+                            ('channel_id', 'page_offset')),
+            (channel_id, page_offset, page_hash, page_size)
+        )
+    
+    # Bulk loading
+    
+    def merge_staged(self, files):
+        """Load a spooled segment into staging tables and merge it, without the commit
+        
+        files maps STAGED_TABLES names to the segment's files. Each file is
+        bulk-loaded into a temporary table private to this connection, then
+        merged with one INSERT ... SELECT, so a segment costs a few statements
+        however many rows it holds.
+        """
+        for table, (columns, keys, extra_updates) in STAGED_TABLES.items():
+            path = files.get(table)
+            if path is None:
+                continue
+            
+            staging = f'{table}_staging'
+            column_list = ', '.join(columns)
+            self.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} AS SELECT {column_list} FROM {table} WHERE 1 = 0")
+            self.execute(f"DELETE FROM {staging}")
+            self.load_staging(staging, columns, path)
+            
+            self.count_staged_changes(table, staging)
+            
+            # WHERE TRUE stops SQLite reading the upsert's ON CONFLICT as a join constraint
+            select = f"SELECT {column_list} FROM {staging} WHERE TRUE"
+            if keys:
+                self.execute(self.upsert_sql(table, columns, keys, extra_updates, select))
+            else:
+                cursor = self.execute(self.insert_ignore_sql(table, columns, select))
+                if table == 'user_channel':
+                    self.add_to_summary(total_relationships=cursor.rowcount)
+    
+    def load_staging(self, staging, columns, path):
+        """Bulk-load a staged file into a staging table"""
+        raise NotImplementedError
+    
+    # Scraper reads
+    
+    def load_checkpoints(self):
+        """Saved progress for every channel as {channel_id: (offset, completed)}"""
+        cursor = self.execute("SELECT channel_id, last_offset, completed FROM scrape_checkpoints")
+        return {
+            channel_id: (last_offset, bool(completed))
+            for channel_id, last_offset, completed in cursor.fetchall()
+        }
+    
+    def load_channel_state(self):
+        """Stored member counts and scrape age as {channel_id: (participants_count, age_seconds)}"""
+        cursor = self.execute(f"""
+            SELECT id, participants_count, {self.age_seconds_sql('scraped_at')}
+            FROM channels
+        """)
+        return {
+            channel_id: (participants_count, age_seconds)
+            for channel_id, participants_count, age_seconds in cursor.fetchall()
+        }
+    
+    def load_access_hashes(self):
+        """Stored access hashes as {channel_id: access_hash}, to address channels without resolving them"""
+        return dict(self.execute("SELECT id, access_hash FROM channels").fetchall())
+    
+    def load_page_hashes(self, channel_id):
+        """Stored page hashes of a channel as {page_offset: (page_hash, page_size)}"""
+        cursor = self.execute("""
+            SELECT page_offset, page_hash, page_size
+            FROM participant_pages
+            WHERE channel_id = %s
+        """, (channel_id,))
+        return {page_offset: (page_hash, page_size) for page_offset, page_hash, page_size in cursor.fetchall()}
+    
+    def load_user_rows(self, limit):
+        """Up to limit stored users as UserRow records"""
+        cursor = self.execute(f"""
+            SELECT {', '.join(UserRow._fields)}
+            FROM users
+            LIMIT %s
+        """, (limit,))
+        return [UserRow(*row) for row in cursor.fetchall()]
+    
+    # Change log
+    
+    def load_member_ids(self, channel_id):
+        """Stored members of a channel as a sorted array of user ids"""
+        return array('q', (user_id for (user_id,) in self.stream("""
+            SELECT user_id FROM user_channel
+            WHERE channel_id = %s
+            ORDER BY user_id
+        """, (channel_id,))))
+    
+    def user_field_changes(self, rows):
+        """(user_id, field, old, new) for tracked fields of rows that differ from the stored users"""
+        if not rows:
+            return []
+        
+        placeholders = ', '.join(['%s'] * len(rows))
+        stored = {
+            row[0]: row[1:] for row in self.execute(f"""
+                SELECT id, {', '.join(TRACKED_USER_FIELDS)}
+                FROM users
+                WHERE id IN ({placeholders})
+            """, [row.id for row in rows]).fetchall()
+        }
+        
+        changes = []
+        for row in rows:
+            old_values = stored.get(row.id)
+            # New users are a join, not a change
+            if old_values is None:
+                continue
+            
+            for field, old in zip(TRACKED_USER_FIELDS, old_values):
+                new = getattr(row, field)
+                if field.startswith('is_'):
+                    old, new = int(bool(old)), int(bool(new))
+                if old != new:
+                    changes.append((row.id, field, None if old is None else str(old), None if new is None else str(new)))
+        return changes
+    
+    def record_user_changes(self, changes):
+        self.executemany(
+            f"INSERT INTO user_changes {self.values_sql(('user_id', 'field', 'old_value', 'new_value'))}",
+            changes
+        )
+    
+    def record_membership_changes(self, channel_id, user_ids, change):
+        """Log users joining or leaving a channel; change is 'join' or 'leave'"""
+        self.executemany(
+            f"INSERT INTO membership_changes {self.values_sql(('channel_id', 'user_id', 'change_type'))}",
+            [(channel_id, user_id, change) for user_id in user_ids]
+        )
+    
+    def unlink_users(self, channel_id, user_ids, batch_size=500):
+        """Remove users who are no longer members of a channel, one DELETE per batch_size ids"""
+        deleted = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = tuple(user_ids[start:start + batch_size])
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor = self.execute(
+                f"DELETE FROM user_channel WHERE channel_id = %s AND user_id IN ({placeholders})",
+                (channel_id,) + batch
+            )
+            deleted += cursor.rowcount
+        self.add_to_summary(total_relationships=-deleted)
+    
+    # Summary statistics
+    
+    def setup_summary_stats(self):
+        """Drop the row triggers older versions kept summary_stats with, and seed it once"""
+        existing = self.existing_triggers()
+        for name in LEGACY_SUMMARY_TRIGGERS:
+            if name in existing:
+                self.execute(f"DROP TRIGGER IF EXISTS {name}")
+        self.commit()
+        
+        stored = dict(self.execute("SELECT name, value FROM summary_stats").fetchall())
+        if not all(key in stored for key in SUMMARY_KEYS):
+            self.refresh_summary()
+    
+    def add_to_summary(self, **deltas):
+        """Add to summary_stats counters when the open transaction commits"""
+        for key, delta in deltas.items():
+            if delta:
+                self.summary_deltas[key] = self.summary_deltas.get(key, 0) + delta
+    
+    def apply_summary_deltas(self):
+        """One UPDATE for every counter the transaction changed, right before its commit
+        
+        Deferred to here so the summary_stats rows, which every writer
+        updates, stay locked only for the commit itself.
+        """
+        deltas = {key: int(delta) for key, delta in self.summary_deltas.items() if delta}
+        self.summary_deltas = {}
+        if not deltas:
+            return
+        
+        cases = ' '.join(f"WHEN '{key}' THEN %s" for key in deltas)
+        keys = ', '.join(f"'{key}'" for key in deltas)
+        self.execute(
+            f"UPDATE summary_stats SET value = value + CASE name {cases} ELSE 0 END WHERE name IN ({keys})",
+            tuple(deltas.values())
+        )
+    
+    def count_user_changes(self, rows, stored_flags=None):
+        """Summary deltas of upserting rows, from the summary flags of the stored versions
+        
+        Flags missing from stored_flags cost one SELECT for the whole batch.
+        """
+        rows = {row.id: row for row in rows}
+        if not rows:
+            return
+        
+        stored = dict(stored_flags or {})
+        unknown = [user_id for user_id in rows if user_id not in stored]
+        if unknown:
+            placeholders = ', '.join(['%s'] * len(unknown))
+            stored.update(self.execute(f"""
+                SELECT id, (username IS NOT NULL) + 2 * COALESCE(is_bot, 0) + 4 * COALESCE(is_verified, 0)
+                FROM users
+                WHERE id IN ({placeholders})
+            """, unknown).fetchall())
+        
+        new_users = with_username = bots = verified = 0
+        for user_id, row in rows.items():
+            old = stored.get(user_id)
+            if old is None:
+                new_users += 1
+                old = 0
+            new = summary_flags(row)
+            with_username += (new & 1) - (old & 1)
+            bots += (new >> 1 & 1) - (old >> 1 & 1)
+            verified += (new >> 2 & 1) - (old >> 2 & 1)
+        
+        self.add_to_summary(total_users=new_users, users_with_username=with_username,
+                            bot_count=bots, verified_count=verified)
+    
+    def count_staged_changes(self, table, staging):
+        """Summary deltas of merging a staging table, counted with one join against the target"""
+        if table == 'users':
+            # Grouped by id, as a segment can hold the same user twice. The merge keeps the last
+            # copy, which the staging table cannot tell apart, so a flag that changed within one
+            # segment counts as set; --refresh recounts exactly
+            row = self.execute(f"""
+                SELECT
+                    COUNT(*) - COUNT(u.id),
+                    SUM(s.has_username) - SUM(u.username IS NOT NULL),
+                    SUM(s.is_bot) - SUM(COALESCE(u.is_bot, 0)),
+                    SUM(s.is_verified) - SUM(COALESCE(u.is_verified, 0))
+                FROM (
+                    SELECT id, MAX(username IS NOT NULL) AS has_username,
+                           MAX(COALESCE(is_bot, 0)) AS is_bot, MAX(COALESCE(is_verified, 0)) AS is_verified
+                    FROM {staging}
+                    GROUP BY id
+                ) s
+                LEFT JOIN users u ON u.id = s.id
+            """).fetchone()
+            new_users, with_username, bots, verified = (value or 0 for value in row)
+            self.add_to_summary(total_users=new_users, users_with_username=with_username,
+                                bot_count=bots, verified_count=verified)
+        elif table == 'channels':
+            (new_channels,) = self.execute(f"""
+                SELECT COUNT(*) FROM (SELECT DISTINCT id FROM {staging}) s
+                WHERE NOT EXISTS (SELECT 1 FROM channels c WHERE c.id = s.id)
+            """).fetchone()
+            self.add_to_summary(total_channels=new_channels)
+    
+    def compute_summary(self):
+        """Overall counts in a single pass over users"""
+        row = self.execute("""
+            SELECT
+                COUNT(*),
+                COUNT(username),
+                COALESCE(SUM(is_bot), 0),
+                COALESCE(SUM(is_verified), 0),
+                (SELECT COUNT(*) FROM channels),
+                (SELECT COUNT(*) FROM user_channel)
+            FROM users
+        """).fetchone()
+        total_users, users_with_username, bot_count, verified_count, total_channels, total_relationships = row
+        
+        return {
+            'total_users': int(total_users),
+            'total_channels': int(total_channels),
+            'total_relationships': int(total_relationships),
+            'users_with_username': int(users_with_username),
+            'bot_count': int(bot_count),
+            'verified_count': int(verified_count),
+        }
+    
+    def refresh_summary(self):
+        """Recompute the summary and store it in summary_stats"""
+        counts = self.compute_summary()
+        # The recount already includes this transaction's writes
+        self.summary_deltas = {}
+        
+        try:
+            self.executemany(
+                self.upsert_sql('summary_stats', ('name', 'value'), ('name',)),
+                list(counts.items())
+            )
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            logger.warning(f"Could not store summary statistics: {e}")
+        
+        return counts
+    
+    # Viewer reads
+    
+    def summary(self, refresh=False):
+        """Overall counts as a dict, from summary_stats unless a refresh is asked for"""
+        if not refresh:
+            try:
+                stored = dict(self.execute("SELECT name, value FROM summary_stats").fetchall())
+            except Exception:
+                # Database set up before summary_stats existed
+                self.rollback()
+                stored = {}
+            
+            if all(key in stored for key in SUMMARY_KEYS):
+                return {key: int(stored[key]) for key in SUMMARY_KEYS}
+        
+        return self.refresh_summary()
+    
+    def list_channels(self):
+        cursor = self.execute("""
+            SELECT
+                c.title,
+                c.username,
+                c.participants_count,
+                COUNT(uc.user_id) as scraped_users,
+                c.is_megagroup,
+                c.scraped_at
+            FROM channels c
+            LEFT JOIN user_channel uc ON c.id = uc.channel_id
+            GROUP BY c.id
+            ORDER BY scraped_users DESC
+        """)
+        return cursor.fetchall()
+    
+    def search_users(self, query, limit=50, batch_size=500):
+        """Users matching query, best matches first, yielded as they are found
+        
+        Exact and prefix username matches come from the username index, then
+        the name search index fills the rest. Each step's matches are looked
+        up in batches, so the first results arrive before the last step runs
+        and channel counts are computed for the returned users only.
+        """
+        username = query.lstrip('@')
+        seen = set()
+        
+        def steps():
+            yield f"SELECT id FROM users WHERE username = %s{self.nocase} LIMIT %s", (username, limit)
+            yield f"""
+                SELECT id FROM users
+                WHERE username LIKE %s ESCAPE '!'
+                ORDER BY username{self.nocase}
+                LIMIT %s
+            """, (like_escape(username) + '%', limit)
+            yield self.name_search_sql(query, limit)
+        
+        for sql, params in steps():
+            if len(seen) >= limit:
+                return
+            
+            user_ids = []
+            for (user_id,) in self.execute(sql, params).fetchall():
+                if user_id not in seen and len(seen) < limit:
+                    seen.add(user_id)
+                    user_ids.append(user_id)
+            
+            for start in range(0, len(user_ids), batch_size):
+                yield from self.users_with_channel_counts(user_ids[start:start + batch_size])
+    
+    def name_search_sql(self, query, limit):
+        """Fallback substring scan over the name columns, used without a search index"""
+        pattern = f"%{like_escape(query)}%"
+        return f"""
+            SELECT id FROM users
+            WHERE username LIKE %s ESCAPE '!'
+               OR first_name LIKE %s ESCAPE '!'
+               OR last_name LIKE %s ESCAPE '!'
+            LIMIT %s
+        """, (pattern, pattern, pattern, limit)
+    
+    def users_with_channel_counts(self, user_ids):
+        """Search result rows for user_ids, in that order"""
+        if not user_ids:
+            return []
+        
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        users = {
+            row[0]: row for row in self.execute(f"""
+                SELECT id, username, first_name, last_name, is_bot, is_verified
+                FROM users
+                WHERE id IN ({placeholders})
+            """, user_ids).fetchall()
+        }
+        counts = dict(self.execute(f"""
+            SELECT user_id, COUNT(*)
+            FROM user_channel
+            WHERE user_id IN ({placeholders})
+            GROUP BY user_id
+        """, user_ids).fetchall())
+        
+        return [(*users[user_id], counts.get(user_id, 0)) for user_id in user_ids if user_id in users]
+    
+    def membership_signature(self):
+        """Value that changes whenever user_channel may have, for caching analytics built from it"""
+        (scraped_at,) = self.execute("SELECT MAX(scraped_at) FROM channels").fetchone()
+        return f"{self.summary()['total_relationships']}:{scraped_at}"
+    
+    def stream_memberships(self):
+        """Every (user_id, channel_id) link, streamed"""
+        return self.stream("SELECT user_id, channel_id FROM user_channel")
+    
+    def channel_titles(self):
+        return dict(self.execute("SELECT id, title FROM channels").fetchall())
+    
+    def build_search_index(self):
+        """Create the indexes behind search_users"""
+        raise NotImplementedError
+    
+    def find_channel(self, name):
+        """Channel for name as (id, title): exact id or username first, then a title/username substring"""
+        name = name.strip()
+        channel_id = parse_channel_id(name)
+        if channel_id is not None:
+            cursor = self.execute("SELECT id, title FROM channels WHERE id = %s", (channel_id,))
+            channel = cursor.fetchone()
+            if channel:
+                return channel
+        
+        cursor = self.execute(f"""
+            SELECT id, title FROM channels
+            WHERE username = %s{self.nocase}
+            LIMIT 1
+        """, (name.lstrip('@'),))
+        channel = cursor.fetchone()
+        if channel:
+            return channel
+        
+        pattern = f"%{like_escape(name)}%"
+        cursor = self.execute("""
+            SELECT id, title FROM channels
+            WHERE title LIKE %s ESCAPE '!' OR username LIKE %s ESCAPE '!'
+            ORDER BY participants_count DESC
+            LIMIT 1
+        """, (pattern, pattern))
+        return cursor.fetchone()
+    
+    def channel_users(self, channel_id, after=None, limit=100):
+        """A channel's members in user id order, starting after the given user id, streamed
+        
+        The (channel_id, user_id) index serves both the filter and the order,
+        so a page deep into a large channel costs the same as the first one.
+        Without a limit the rest of the channel is streamed.
+        """
+        where, params = "uc.channel_id = %s", (channel_id,)
+        if after is not None:
+            where, params = where + " AND uc.user_id > %s", params + (after,)
+        limit_sql = ''
+        if limit is not None:
+            limit_sql, params = "LIMIT %s", params + (limit,)
+        
+        return self.stream(f"""
+            SELECT
+                u.id,
+                u.username,
+                u.first_name,
+                u.last_name,
+                u.is_bot,
+                u.is_verified,
+                uc.scraped_at
+            FROM user_channel uc
+            JOIN users u ON u.id = uc.user_id
+            WHERE {where}
+            ORDER BY uc.user_id
+            {limit_sql}
+        """, params)
+    
+    def recent_changes(self, limit=50):
+        """Latest membership and field changes, oldest first, as (changed_at, user_id, change)"""
+        memberships = self.execute("""
+            SELECT m.changed_at, m.user_id, m.change_type, c.title
+            FROM membership_changes m
+            LEFT JOIN channels c ON c.id = m.channel_id
+            ORDER BY m.id DESC
+            LIMIT %s
+        """, (limit,)).fetchall()
+        fields = self.execute("""
+            SELECT changed_at, user_id, field, old_value, new_value
+            FROM user_changes
+            ORDER BY id DESC
+            LIMIT %s
+        """, (limit,)).fetchall()
+        
+        changes = [
+            (changed_at, user_id, f"{change_type}s {title}")
+            for changed_at, user_id, change_type, title in memberships
+        ] + [
+            (changed_at, user_id, f"{field}: {old_value} -> {new_value}")
+            for changed_at, user_id, field, old_value, new_value in fields
+        ]
+        return sorted(changes, key=lambda change: change[0])[-limit:]
+    
+    def export_users(self, batch_size=5000):
+        """Yield batches of users with the titles of the channels they were seen in
+        
+        Users are read in id order a batch at a time (keyset pagination, so
+        each batch is an index range scan however deep the export gets) and
+        their memberships fetched for the same id range. Channels come back as
+        a list, so nothing is lost to GROUP_CONCAT length limits and memory
+        stays bounded by the batch size.
+        """
+        titles = dict(self.execute("SELECT id, title FROM channels").fetchall())
+        last_id = None
+        
+        while True:
+            if last_id is None:
+                where, params = '', (batch_size,)
+            else:
+                where, params = 'WHERE id > %s', (last_id, batch_size)
+            
+            users = list(self.stream(f"""
+                SELECT
+                    id, access_hash, username, first_name, last_name, phone,
+                    is_bot, is_verified, is_restricted, is_scam, is_fake
+                FROM users
+                {where}
+                ORDER BY id
+                LIMIT %s
+            """, params))
+            if not users:
+                return
+            
+            first_id, last_id = users[0][0], users[-1][0]
+            channels = {}
+            for user_id, channel_id in self.stream("""
+                SELECT user_id, channel_id FROM user_channel
+                WHERE user_id BETWEEN %s AND %s
+            """, (first_id, last_id)):
+                channels.setdefault(user_id, []).append(titles.get(channel_id))
+            
+            yield [(*user, sorted(channels.get(user[0], ()), key=str)) for user in users]
+
+class MySQLStorage(Storage):
+    """Remote MySQL through pymysql"""
+    
+    name = 'mysql'
+    # Set before connecting to let LOAD DATA LOCAL send staged files from this machine
+    local_infile = False
+    
+    tables = {
+        'users': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id BIGINT PRIMARY KEY,
+                access_hash BIGINT,
+                username VARCHAR(255),
+                first_name VARCHAR(255),
+                last_name VARCHAR(255),
+                phone VARCHAR(50),
+                is_bot BOOLEAN DEFAULT FALSE,
+                is_verified BOOLEAN DEFAULT FALSE,
+                is_restricted BOOLEAN DEFAULT FALSE,
+                is_scam BOOLEAN DEFAULT FALSE,
+                is_fake BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_username (username)
+            )
+        """,
+        'channels': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id BIGINT PRIMARY KEY,
+                access_hash BIGINT,
+                title VARCHAR(255),
+                username VARCHAR(255),
+                participants_count INT,
+                is_megagroup BOOLEAN DEFAULT FALSE,
+                is_broadcast BOOLEAN DEFAULT FALSE,
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_channel_username (username)
+            )
+        """,
+        # Many-to-many relationship, clustered by user; the secondary index
+        # covers member listings by channel
+        'user_channel': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                user_id BIGINT NOT NULL,
+                channel_id BIGINT NOT NULL,
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, channel_id),
+                INDEX idx_channel_user (channel_id, user_id, scraped_at)
+            )
+        """,
+        # Progress per channel for --resume
+        'scrape_checkpoints': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                channel_id BIGINT PRIMARY KEY,
+                last_offset INT NOT NULL DEFAULT 0,
+                completed BOOLEAN DEFAULT FALSE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )
+        """,
+        # Per-page id hashes for --incremental
+        'participant_pages': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                channel_id BIGINT NOT NULL,
+                page_offset INT NOT NULL,
+                page_hash BIGINT NOT NULL,
+                page_size INT NOT NULL,
+                PRIMARY KEY (channel_id, page_offset)
+            )
+        """,
+        # Counters for --summary, kept current by the writers
+        'summary_stats': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                name VARCHAR(64) PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0
+            )
+        """,
+        # Append-only change logs for --track-changes, read downstream by id
+        'membership_changes': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                channel_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                change_type VARCHAR(8) NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_membership_channel (channel_id, changed_at)
+            )
+        """,
+        'user_changes': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                field VARCHAR(32) NOT NULL,
+                old_value VARCHAR(255),
+                new_value VARCHAR(255),
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_user_changes_user (user_id)
+            )
+        """,
+    }
+    
+    def __init__(self, db_config, database='telescrape', **options):
+        super().__init__(**options)
+        self.db_config = db_config
+        self.database = database
+    
+    def open_connection(self):
+        import pymysql
+        
+        # A dead link fails within the timeouts instead of hanging the run
+        connection = pymysql.connect(**{
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.query_timeout,
+            'write_timeout': self.query_timeout,
+            'local_infile': self.local_infile,
+            **self.db_config
+        })
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+        connection.select_db(self.database)
+        logger.info("Connected to MySQL database")
+        return connection
+    
+    def ping(self, connection):
+        connection.ping(reconnect=False)
+    
+    def is_transient(self, error):
+        import pymysql
+        
+        if isinstance(error, pymysql.err.InterfaceError):
+            return True
+        # Server gone away or lost mid-query, lost handshake, lock wait timeout, deadlock
+        return isinstance(error, pymysql.err.OperationalError) and bool(error.args) and \
+            error.args[0] in (2003, 2006, 2013, 2055, 1205, 1213)
+    
+    def stream(self, query, params=()):
+        """Yield rows from an unbuffered server-side cursor"""
+        import pymysql
+        
+        cursor = self.connection.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(self.sql(query), params)
+            yield from cursor
+        finally:
+            cursor.close()
+    
+    def upsert_sql(self, table, columns, keys, extra_updates=(), select=None):
+        updates = [f"{column} = VALUES({column})" for column in columns if column not in keys]
+        updates.extend(extra_updates)
+        return f"""
+            INSERT INTO {table} {self.values_sql(columns, select)}
+            ON DUPLICATE KEY UPDATE {', '.join(updates)}
+        """
+    
+    def insert_ignore_sql(self, table, columns, select=None):
+        return f"INSERT IGNORE INTO {table} {self.values_sql(columns, select)}"
+    
+    def age_seconds_sql(self, column):
+        return f"TIMESTAMPDIFF(SECOND, {column}, NOW())"
+    
+    def load_staging(self, staging, columns, path):
+        # Staged files are in LOAD DATA's default format, so no FIELDS/LINES clauses are needed
+        self.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {staging} CHARACTER SET utf8mb4 ({', '.join(columns)})",
+            (path,)
+        )
+    
+    def existing_triggers(self):
+        cursor = self.execute("SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()")
+        return {name for (name,) in cursor.fetchall()}
+    
+    def existing_indexes(self, table):
+        cursor = self.execute("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,))
+        return {name for (name,) in cursor.fetchall()}
+    
+    def table_columns(self, table):
+        cursor = self.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,))
+        return [name for (name,) in cursor.fetchall()]
+    
+    def has_search_index(self):
+        return 'ft_user_names' in self.existing_indexes('users')
+    
+    @contextmanager
+    def migration_lock(self):
+        # Named locks are server-wide and survive the per-chunk commits
+        name = f'{self.database}.migration'
+        while self.execute("SELECT GET_LOCK(%s, 60)", (name,)).fetchone()[0] != 1:
+            logger.info("Waiting for another process to finish migrating the schema")
+        try:
+            yield
+        finally:
+            self.execute("SELECT RELEASE_LOCK(%s)", (name,))
+    
+    def other_sessions(self):
+        # Processes queued on the migration lock re-check the version before writing anything
+        (sessions,) = self.execute("""
+            SELECT COUNT(*) FROM information_schema.PROCESSLIST
+            WHERE DB = DATABASE() AND ID <> CONNECTION_ID()
+              AND COALESCE(STATE, '') NOT LIKE '%%user lock%%'
+        """).fetchone()
+        return sessions
+    
+    def swap_table(self, table, replacement):
+        # A multi-table RENAME is atomic, readers never see the table missing
+        self.execute(f"RENAME TABLE {table} TO {table}_old, {replacement} TO {table}")
+        self.execute(f"DROP TABLE {table}_old")
+    
+    def name_search_sql(self, query, limit):
+        # The ngram parser indexes 2-character tokens, so shorter queries can't use it
+        if len(query) < 2 or not self.has_search_index():
+            return super().name_search_sql(query, limit)
+        
+        phrase = '"' + query.replace('"', ' ') + '"'
+        return """
+            SELECT id FROM users
+            WHERE MATCH (username, first_name, last_name) AGAINST (%s IN BOOLEAN MODE)
+            LIMIT %s
+        """, (phrase, limit)
+    
+    def build_search_index(self):
+        existing = self.existing_indexes('users')
+        changes = []
+        if 'idx_username' not in existing:
+            changes.append("ADD INDEX idx_username (username)")
+        if 'ft_user_names' not in existing:
+            changes.append("ADD FULLTEXT INDEX ft_user_names (username, first_name, last_name) WITH PARSER ngram")
+        
+        if changes:
+            self.execute(f"ALTER TABLE users {', '.join(changes)}")
+            self.commit()
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+sqlite3.register_converter('TIMESTAMP', _parse_timestamp)
+
+class SQLiteStorage(Storage):
+    """Embedded SQLite file in WAL mode, for single-node runs without a network hop"""
+    
+    name = 'sqlite'
+    placeholder = '?'
+    nocase = ' COLLATE NOCASE'
+    # Set while migration_lock() holds the write transaction
+    migrating = False
+    
+    tables = {
+        'users': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                access_hash INTEGER,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                phone TEXT,
+                is_bot BOOLEAN DEFAULT FALSE,
+                is_verified BOOLEAN DEFAULT FALSE,
+                is_restricted BOOLEAN DEFAULT FALSE,
+                is_scam BOOLEAN DEFAULT FALSE,
+                is_fake BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        'channels': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                access_hash INTEGER,
+                title TEXT,
+                username TEXT,
+                participants_count INTEGER,
+                is_megagroup BOOLEAN DEFAULT FALSE,
+                is_broadcast BOOLEAN DEFAULT FALSE,
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        # Clustered on the composite key instead of a hidden rowid
+        'user_channel': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                user_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, channel_id)
+            ) WITHOUT ROWID
+        """,
+        'scrape_checkpoints': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                channel_id INTEGER PRIMARY KEY,
+                last_offset INTEGER NOT NULL DEFAULT 0,
+                completed BOOLEAN DEFAULT FALSE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        'participant_pages': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                channel_id INTEGER NOT NULL,
+                page_offset INTEGER NOT NULL,
+                page_hash INTEGER NOT NULL,
+                page_size INTEGER NOT NULL,
+                PRIMARY KEY (channel_id, page_offset)
+            )
+        """,
+        'summary_stats': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        """,
+        'membership_changes': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                change_type TEXT NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        'user_changes': """
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                field TEXT NOT NULL,
+                old_value TEXT,
+                new_value TEXT,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+    }
+    
+    # SQLite index names are database-wide, so these are created once the tables have their final names
+    indexes = (
+        "CREATE INDEX IF NOT EXISTS idx_username ON users (username COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_channel_username ON channels (username COLLATE NOCASE)",
+        # Covers member listings by channel
+        "CREATE INDEX IF NOT EXISTS idx_channel_user ON user_channel (channel_id, user_id, scraped_at)",
+        "CREATE INDEX IF NOT EXISTS idx_membership_channel ON membership_changes (channel_id, changed_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_changes_user ON user_changes (user_id)",
+    )
+    
+    def __init__(self, path='telescrape.db', **options):
+        super().__init__(**options)
+        self.path = path
+    
+    def open_connection(self):
+        # The writer thread owns its own connection but it is created on the main thread
+        connection = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        # WAL lets the viewer and the scraper's reads run while the writer commits
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        logger.info(f"Opened SQLite database {self.path}")
+        return connection
+    
+    def ping(self, connection):
+        connection.execute("SELECT 1")
+    
+    def is_transient(self, error):
+        # Still locked after busy_timeout
+        return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+    
+    def upsert_sql(self, table, columns, keys, extra_updates=(), select=None):
+        updates = [f"{column} = excluded.{column}" for column in columns if column not in keys]
+        updates.extend(extra_updates)
+        return f"""
+            INSERT INTO {table} {self.values_sql(columns, select)}
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}
+        """
+    
+    def insert_ignore_sql(self, table, columns, select=None):
+        return f"INSERT OR IGNORE INTO {table} {self.values_sql(columns, select)}"
+    
+    def age_seconds_sql(self, column):
+        return f"CAST((julianday('now') - julianday({column})) * 86400 AS INTEGER)"
+    
+    def load_staging(self, staging, columns, path):
+        # No LOAD DATA in SQLite; one executemany over the parsed file is the in-process equivalent
+        self.executemany(f"INSERT INTO {staging} {self.values_sql(columns)}", read_staged(path))
+    
+    def existing_triggers(self):
+        cursor = self.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        return {name for (name,) in cursor.fetchall()}
+    
+    def has_table(self, name):
+        cursor = self.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (name,))
+        return cursor.fetchone() is not None
+    
+    def table_columns(self, table):
+        return [row[1] for row in self.execute(f"PRAGMA table_info({table})").fetchall()]
+    
+    def has_search_index(self):
+        return self.has_table('users_fts')
+    
+    def commit(self):
+        # Held open by migration_lock() until the whole migration is done
+        if not self.migrating:
+            super().commit()
+    
+    @contextmanager
+    def migration_lock(self):
+        # One write transaction for the whole migration: other writers wait, WAL readers carry on
+        self.commit()
+        while True:
+            try:
+                self.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                logger.info("Waiting for another process to finish migrating the schema")
+        
+        self.migrating = True
+        try:
+            yield
+        except Exception:
+            self.migrating = False
+            self.rollback()
+            raise
+        self.migrating = False
+        self.commit()
+    
+    def swap_table(self, table, replacement):
+        # Runs inside the migration's transaction, so the swap is atomic
+        self.execute(f"DROP TABLE {table}")
+        self.execute(f"ALTER TABLE {replacement} RENAME TO {table}")
+    
+    def name_search_sql(self, query, limit):
+        # The trigram tokenizer needs at least 3 characters
+        if len(query) < 3 or not self.has_search_index():
+            return super().name_search_sql(query, limit)
+        
+        phrase = '"' + query.replace('"', '""') + '"'
+        return "SELECT rowid FROM users_fts WHERE users_fts MATCH %s LIMIT %s", (phrase, limit)
+    
+    def build_search_index(self):
+        # External-content FTS5 table over the name columns, kept in sync by triggers.
+        # One statement at a time: executescript() would commit a migration's transaction
+        statements = (
+            "CREATE INDEX IF NOT EXISTS idx_username ON users (username COLLATE NOCASE)",
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                username, first_name, last_name,
+                content='users', content_rowid='id', tokenize='trigram'
+            )
+            """,
+            "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+            """
+            CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+                INSERT INTO users_fts (rowid, username, first_name, last_name)
+                VALUES (new.id, new.username, new.first_name, new.last_name);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+                INSERT INTO users_fts (users_fts, rowid, username, first_name, last_name)
+                VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE ON users
+            WHEN old.username IS NOT new.username
+              OR old.first_name IS NOT new.first_name
+              OR old.last_name IS NOT new.last_name
+            BEGIN
+                INSERT INTO users_fts (users_fts, rowid, username, first_name, last_name)
+                VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+                INSERT INTO users_fts (rowid, username, first_name, last_name)
+                VALUES (new.id, new.username, new.first_name, new.last_name);
+            END
+            """,
+        )
+        for statement in statements:
+            self.execute(statement)
+        self.commit()
+
+def create_storage(backend, db_config=None, sqlite_path='telescrape.db', **options):
+    """Build an unconnected storage for the --backend command line option"""
+    if backend == 'mysql':
+        return MySQLStorage(db_config, **options)
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path, **options)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+def add_storage_arguments(parser):
+    """Add the database options shared by both tools"""
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='mysql',
+                        help='Database to use: the configured MySQL server or a local SQLite file')
+    parser.add_argument('--sqlite-path', type=str, default='telescrape.db',
+                        help='SQLite database file for --backend sqlite')
+    parser.add_argument('--db-connect-timeout', type=float, default=10,
+                        help='Seconds to wait when connecting to MySQL')
+    parser.add_argument('--db-query-timeout', type=float, default=300,
+                        help='Seconds a MySQL read or write may take before the connection counts as dead')
+    parser.add_argument('--db-retries', type=int, default=3,
+                        help='Times a write batch is rerun on a new connection after the old one drops')
+
+def storage_options(args):
+    """Keyword arguments for create_storage from the add_storage_arguments options"""
+    return {
+        'connect_timeout': args.db_connect_timeout,
+        'query_timeout': args.db_query_timeout,
+        'retries': args.db_retries,
+    }
@@ -1,13 +1,30 @@
 import argparse
 import asyncio
-import pymysql
+import cProfile
+from array import array
 from telethon import TelegramClient
-from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.functions.channels import GetParticipantsRequest, GetFullChannelRequest
 from telethon.tl.types import ChannelParticipantsSearch
+from telethon.tl.types.channels import ChannelParticipantsNotModified
 from telethon.errors import ChatAdminRequiredError, UserPrivacyRestrictedError
 from datetime import datetime
 import logging
 import os
+import queue
+import threading
+import time
+
+from bulkload import StagingSpool
+from cache import UserCache
+from daemon import ScrapeDaemon, parse_schedule
+from entities import STALE_HASH_ERRORS, EntityCache
+from idsets import contains, difference, sorted_ids
+from metrics import Metrics
+from rows import channel_row, user_rows
+from scheduler import ORDERS, ChannelScheduler
+from snapshots import SnapshotStore
+from storage import add_storage_arguments, create_storage, storage_options
+from throttle import AdaptiveThrottle
 
 # Set up logging
 logging.basicConfig(
@@ -20,14 +37,313 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def participants_hash(user_ids):
+    """Telegram's 64-bit list hash over a page of user ids, as sent in GetParticipantsRequest"""
+    value = 0
+    for user_id in user_ids:
+        value ^= value >> 21
+        value ^= (value << 35) & 0xFFFFFFFFFFFFFFFF
+        value ^= value >> 4
+        value = (value + user_id) & 0xFFFFFFFFFFFFFFFF
+    
+    # The TL field is a signed long
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+class DatabaseWriter:
+    """Write-behind stage that drains scraped pages into the database on its own thread"""
+    
+    def __init__(self, storage, max_pending=20, user_cache=None, warm_cache=False, metrics=None,
+                 track_changes=False):
+        self.storage = storage
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.user_cache = user_cache or UserCache(0)
+        self.warm_cache = warm_cache
+        self.metrics = metrics or Metrics()
+        self.track_changes = track_changes
+        self.thread = None
+    
+    def start(self):
+        """Open the writer's own connection and start draining the queue"""
+        # Database connections are not thread safe, so the writer never shares one
+        self.storage.connect()
+        
+        if self.warm_cache and self.user_cache.max_size:
+            rows = self.storage.load_user_rows(self.user_cache.max_size)
+            self.user_cache.add(rows)
+            # Holding every stored user, a cache miss is a new user and needs no lookup
+            self.user_cache.complete = len(rows) < self.user_cache.max_size
+            logger.info(f"Warmed user cache with {len(self.user_cache.entries)} stored users")
+        elif self.user_cache.max_size:
+            self.user_cache.complete = not self.storage.load_user_rows(1)
+        
+        self.thread = threading.Thread(target=self.drain, name='db-writer', daemon=True)
+        self.thread.start()
+        logger.info(f"Database writer started (queue size {self.queue.maxsize})")
+    
+    async def submit(self, method, *args):
+        """Queue a write, waiting for room when the writer falls behind"""
+        try:
+            self.queue.put_nowait((method, args))
+        except queue.Full:
+            # Backpressure: block a worker thread, not the event loop
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.queue.put, (method, args))
+            self.metrics.inc('telescrape_writer_backpressure_seconds_total', time.perf_counter() - started)
+        
+        self.metrics.set('telescrape_write_queue_depth', self.queue.qsize())
+    
+    def drain(self):
+        """Apply queued writes in order until the stop marker arrives"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.metrics.set('telescrape_write_queue_depth', self.queue.qsize())
+            
+            method, args = item
+            try:
+                with self.metrics.timer('telescrape_db_write_seconds', operation=method.__name__):
+                    method(*args)
+            except Exception as e:
+                logger.error(f"Database writer failed on {method.__name__}: {e}")
+    
+    def close(self):
+        """Flush pending writes and stop the writer thread"""
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            logger.info("Database writer flushed and stopped")
+        
+        self.storage.close()
+    
+    def save_user(self, row, channel_id):
+        """Save user to database"""
+        try:
+            self.storage.transaction(self.write_users, [row], [row], channel_id)
+            self.user_cache.add([row])
+            
+        except Exception as e:
+            logger.error(f"Error saving user {row.id}: {e}")
+            self.storage.rollback()
+    
+    def save_users(self, rows, channel_id, next_offset=None, page_hash=None, joins=None, fingerprints=None):
+        """Save a page of user rows to database in a single transaction
+        
+        When next_offset is given the channel checkpoint is advanced in the
+        same transaction, so it never points past rows that were not stored.
+        The page hash is kept alongside so incremental runs can ask the server
+        whether the page changed. With change tracking, joins and changed
+        user fields are logged in the same transaction too. A transaction
+        lost with its connection is rerun whole on a new one. Fingerprints
+        computed when the page was converted spare hashing every row again.
+        """
+        if not rows:
+            return
+        
+        changed, changed_fingerprints = self.unstored(rows, fingerprints)
+        
+        try:
+            self.storage.transaction(self.write_users, rows, changed, channel_id, next_offset, page_hash, joins)
+            self.user_cache.add(changed, changed_fingerprints)
+            
+        except Exception as e:
+            logger.warning(f"Batch save of {len(rows)} users failed ({e}), retrying row by row")
+            self.storage.rollback()
+            
+            # Isolate the bad row(s) without losing the rest of the page
+            for row in rows:
+                self.save_user(row, channel_id)
+            
+            if joins:
+                self.save_membership_changes(channel_id, joins, 'join')
+            if next_offset is not None:
+                self.save_checkpoint(channel_id, next_offset)
+    
+    def unstored(self, rows, fingerprints=None):
+        """Rows whose users row has to be written, with their fingerprints"""
+        if fingerprints is None:
+            fingerprints = list(map(self.user_cache.fingerprint, rows))
+        
+        # Users already stored with identical fields across channels only need the link
+        is_stored = self.user_cache.is_stored
+        changed = []
+        changed_fingerprints = []
+        for row, fingerprint in zip(rows, fingerprints):
+            if not is_stored(row, fingerprint):
+                changed.append(row)
+                changed_fingerprints.append(fingerprint)
+        return changed, changed_fingerprints
+    
+    def write_users(self, rows, changed, channel_id, next_offset=None, page_hash=None, joins=None):
+        """Statements of save_users, without the commit"""
+        # executemany() on INSERT ... VALUES becomes multi-row statements under pymysql,
+        # so a whole page costs one round trip per table and a single commit
+        if changed:
+            if self.track_changes:
+                # Compare against the stored rows before they are overwritten
+                self.storage.record_user_changes(self.storage.user_field_changes(changed))
+            self.storage.upsert_users(changed, self.user_cache.stored_flags(changed))
+        self.storage.link_users(channel_id, [row.id for row in rows])
+        if joins:
+            self.storage.record_membership_changes(channel_id, joins, 'join')
+        if next_offset is not None:
+            self.storage.save_checkpoint(channel_id, next_offset, False)
+            if page_hash is not None:
+                self.storage.save_page_hash(channel_id, next_offset - len(rows), page_hash, len(rows))
+    
+    def save_membership_changes(self, channel_id, user_ids, change):
+        """Log joins or leaves; leavers are also unlinked from the channel"""
+        try:
+            self.storage.transaction(self.write_membership_changes, channel_id, user_ids, change)
+            
+        except Exception as e:
+            logger.error(f"Error saving {len(user_ids)} {change}s for channel {channel_id}: {e}")
+            self.storage.rollback()
+    
+    def save_listing(self, channel_id, title, seen, members=None, snapshots=None):
+        """Sort the ids of a complete listing once, then log the leavers and save the snapshot"""
+        ids = sorted_ids(seen)
+        if members:
+            leaves = difference(members, ids)
+            if leaves:
+                logger.info(f"{len(leaves)} users left {title} since the last scrape")
+                self.save_membership_changes(channel_id, list(leaves), 'leave')
+        if snapshots:
+            snapshots.save_snapshot(channel_id, ids, title)
+    
+    def write_membership_changes(self, channel_id, user_ids, change):
+        self.storage.record_membership_changes(channel_id, user_ids, change)
+        if change == 'leave':
+            self.storage.unlink_users(channel_id, user_ids)
+    
+    def save_checkpoint(self, channel_id, offset, completed=False):
+        """Record how far a channel has been scraped"""
+        try:
+            self.storage.transaction(self.storage.save_checkpoint, channel_id, offset, completed)
+            
+        except Exception as e:
+            logger.error(f"Error saving checkpoint for channel {channel_id}: {e}")
+            self.storage.rollback()
+    
+    def save_channel(self, row):
+        """Save channel information to database"""
+        try:
+            self.storage.transaction(self.storage.upsert_channel, row)
+            
+        except Exception as e:
+            logger.error(f"Error saving channel {row.id}: {e}")
+            self.storage.rollback()
+
+class BulkWriter(DatabaseWriter):
+    """Writer for --bulk-load that spools pages to staging files and merges them in segments
+    
+    For first scrapes of very large accounts, where even batched upserts
+    against a remote MySQL are the bottleneck. Pages are appended to the
+    spool, and every segment_rows rows the segment is bulk-loaded into
+    staging tables and merged into users, channels and user_channel in a
+    single transaction, together with the checkpoints it covers.
+    """
+    
+    def __init__(self, storage, spool, max_pending=20, user_cache=None, metrics=None):
+        super().__init__(storage, max_pending, user_cache, metrics=metrics)
+        self.spool = spool
+        # Sealed segments not merged yet, oldest first
+        self.pending = []
+    
+    def start(self):
+        """Merge segments an interrupted run left behind, then start draining the queue"""
+        self.pending = self.spool.recover()
+        if self.pending:
+            # Done before scraping starts so their checkpoints are loaded for --resume
+            self.storage.connect()
+            self.merge_pending()
+            self.storage.close()
+        super().start()
+    
+    def drain(self):
+        super().drain()
+        # Stop marker seen: merge what was spooled since the last full segment
+        self.merge()
+    
+    def merge(self):
+        """Seal the open segment and merge every sealed one, oldest first"""
+        segment = self.spool.seal()
+        if segment:
+            self.pending.append(segment)
+        self.merge_pending()
+    
+    def merge_pending(self):
+        while self.pending:
+            segment = self.pending[0]
+            started = time.perf_counter()
+            try:
+                self.storage.transaction(self.storage.merge_staged, self.spool.staged_files(segment))
+            except Exception as e:
+                # Kept on disk; retried with the next segment or by the next run
+                logger.error(f"Merging bulk-load segment {segment} failed: {e}")
+                self.storage.rollback()
+                return
+            
+            self.spool.remove(segment)
+            self.pending.pop(0)
+            logger.info(f"Merged bulk-load segment {os.path.basename(segment)} "
+                        f"in {time.perf_counter() - started:.1f}s")
+    
+    def save_users(self, rows, channel_id, next_offset=None, page_hash=None, joins=None, fingerprints=None):
+        """Spool a page of user rows, merging the segment once it is full"""
+        if not rows:
+            return
+        
+        changed, changed_fingerprints = self.unstored(rows, fingerprints)
+        self.spool.write('users', changed)
+        self.spool.write('user_channel', [(row.id, channel_id) for row in rows])
+        if next_offset is not None:
+            self.spool.checkpoint(channel_id, next_offset)
+            if page_hash is not None:
+                self.spool.page_hash(channel_id, next_offset - len(rows), page_hash, len(rows))
+        # A segment that fails to merge stays on disk, so these users are not lost
+        self.user_cache.add(changed, changed_fingerprints)
+        
+        if self.spool.full:
+            self.merge()
+    
+    def save_checkpoint(self, channel_id, offset, completed=False):
+        self.spool.checkpoint(channel_id, offset, completed)
+    
+    def save_channel(self, row):
+        self.spool.write('channels', [row])
+
 class TelegramScraper:
-    def __init__(self, session_name, api_id, api_hash, db_config):
+    def __init__(self, session_name, api_id, api_hash, storage, write_queue_size=20, resume=False,
+                 incremental=False, max_age_hours=24, throttle=None, user_cache_size=200000, warm_cache=False,
+                 metrics=None, scheduler=None, track_changes=False, bulk_load=None, bulk_segment_rows=500000,
+                 snapshots=None):
         self.session_name = session_name
         self.api_id = api_id
         self.api_hash = api_hash
-        self.db_config = db_config
+        self.storage = storage
+        self.write_queue_size = write_queue_size
+        self.resume = resume
+        self.incremental = incremental
+        self.max_age_seconds = max_age_hours * 3600
+        self.metrics = metrics or Metrics()
+        self.throttle = throttle or AdaptiveThrottle()
+        # API latency and sleeps are recorded by the throttle
+        self.throttle.metrics = self.metrics
+        self.user_cache = UserCache(user_cache_size)
+        self.warm_cache = warm_cache
+        self.scheduler = scheduler or ChannelScheduler()
+        self.entities = EntityCache(self.metrics)
+        self.track_changes = track_changes
+        self.bulk_load = bulk_load
+        self.bulk_segment_rows = bulk_segment_rows
+        self.snapshots = SnapshotStore(snapshots) if snapshots else None
         self.client = None
-        self.db_connection = None
+        self.writer = None
+        self.checkpoints = {}
+        self.channel_state = {}
         
     async def connect_telegram(self):
         """Connect to Telegram using existing session file"""
@@ -47,7 +363,9 @@ class TelegramScraper:
                 self.api_id, 
                 self.api_hash,
                 connection_retries=5,
-                retry_delay=1
+                retry_delay=1,
+                # Let the throttle see every flood wait instead of Telethon sleeping silently
+                flood_sleep_threshold=0
             )
             
             logger.info(f"Attempting to connect with session: {self.session_name}")
@@ -70,239 +388,231 @@ class TelegramScraper:
             return False
     
     def connect_database(self):
-        """Connect to MySQL database"""
+        """Connect to the database and start the writer"""
         try:
-            self.db_connection = pymysql.connect(**self.db_config)
-            logger.info("Connected to MySQL database")
-            self.setup_database()
+            if self.bulk_load:
+                # The client has to allow LOAD DATA LOCAL as well as the server
+                self.storage.local_infile = True
+            self.storage.connect()
+            self.storage.setup()
+            logger.info("Database tables created/verified")
+            
+            if self.bulk_load:
+                self.writer = BulkWriter(self.storage.copy(), StagingSpool(self.bulk_load, self.bulk_segment_rows),
+                                         self.write_queue_size, self.user_cache, self.metrics)
+            else:
+                self.writer = DatabaseWriter(self.storage.copy(), self.write_queue_size, self.user_cache,
+                                             self.warm_cache, self.metrics, self.track_changes)
+            self.writer.start()
             return True
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             return False
     
-    def setup_database(self):
-        """Create database and tables if they don't exist"""
-        cursor = self.db_connection.cursor()
-        
-        # Create database if not exists
-        cursor.execute("CREATE DATABASE IF NOT EXISTS telescrape")
-        cursor.execute("USE telescrape")
+    def load_checkpoints(self):
+        """Load saved progress for every channel"""
+        self.checkpoints = self.storage.transaction(self.storage.load_checkpoints)
         
-        # Create users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id BIGINT PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                access_hash BIGINT,
-                username VARCHAR(255),
-                first_name VARCHAR(255),
-                last_name VARCHAR(255),
-                phone VARCHAR(50),
-                is_bot BOOLEAN DEFAULT FALSE,
-                is_verified BOOLEAN DEFAULT FALSE,
-                is_restricted BOOLEAN DEFAULT FALSE,
-                is_scam BOOLEAN DEFAULT FALSE,
-                is_fake BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user_id (user_id)
-            )
-        """)
+        finished = sum(1 for _, completed in self.checkpoints.values() if completed)
+        logger.info(f"Loaded {len(self.checkpoints)} checkpoints ({finished} channels finished)")
+    
+    def is_unchanged(self, channel):
+        """Check whether a fully scraped channel still has the member count we stored recently"""
+        checkpoint = self.checkpoints.get(channel.id)
+        if not checkpoint or not checkpoint[1]:
+            return False
         
-        # Create channels table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS channels (
-                id BIGINT PRIMARY KEY,
-                channel_id BIGINT NOT NULL,
-                access_hash BIGINT,
-                title VARCHAR(255),
-                username VARCHAR(255),
-                participants_count INT,
-                is_megagroup BOOLEAN DEFAULT FALSE,
-                is_broadcast BOOLEAN DEFAULT FALSE,
-                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_channel_id (channel_id)
-            )
-        """)
+        if channel.id not in self.channel_state:
+            return False
         
-        # Create user_channel table (many-to-many relationship)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_channel (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                channel_id BIGINT NOT NULL,
-                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_user_channel (user_id, channel_id),
-                INDEX idx_user (user_id),
-                INDEX idx_channel (channel_id)
-            )
-        """)
+        participants_count, age_seconds = self.channel_state[channel.id]
+        if participants_count is None or participants_count != channel.participants_count:
+            return False
         
-        self.db_connection.commit()
-        logger.info("Database tables created/verified")
+        return age_seconds is not None and age_seconds < self.max_age_seconds
     
-    def save_user(self, user, channel_id):
-        """Save user to database"""
-        cursor = self.db_connection.cursor()
+    async def iter_participant_pages(self, channel_entity, offset=0, page_hashes=None, limit=100):
+        """Stream a channel's members as (next_offset, rows, page_hash, fingerprints) pages
         
-        try:
-            # Insert or update user
-            cursor.execute("""
-                INSERT INTO users (
-                    id, user_id, access_hash, username, first_name, last_name, 
-                    phone, is_bot, is_verified, is_restricted, is_scam, is_fake
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    access_hash = VALUES(access_hash),
-                    username = VALUES(username),
-                    first_name = VALUES(first_name),
-                    last_name = VALUES(last_name),
-                    phone = VALUES(phone),
-                    is_bot = VALUES(is_bot),
-                    is_verified = VALUES(is_verified),
-                    is_restricted = VALUES(is_restricted),
-                    is_scam = VALUES(is_scam),
-                    is_fake = VALUES(is_fake)
-            """, (
-                user.id,
-                user.id,
-                user.access_hash if hasattr(user, 'access_hash') else None,
-                user.username,
-                user.first_name,
-                user.last_name if hasattr(user, 'last_name') else None,
-                user.phone if hasattr(user, 'phone') else None,
-                user.bot if hasattr(user, 'bot') else False,
-                user.verified if hasattr(user, 'verified') else False,
-                user.restricted if hasattr(user, 'restricted') else False,
-                user.scam if hasattr(user, 'scam') else False,
-                user.fake if hasattr(user, 'fake') else False
-            ))
-            
-            # Link user to channel
-            cursor.execute("""
-                INSERT IGNORE INTO user_channel (user_id, channel_id)
-                VALUES (%s, %s)
-            """, (user.id, channel_id))
-            
-            self.db_connection.commit()
-            
-        except Exception as e:
-            logger.error(f"Error saving user {user.id}: {e}")
-            self.db_connection.rollback()
-    
-    def save_channel(self, channel):
-        """Save channel information to database"""
-        cursor = self.db_connection.cursor()
+        Each page is converted to compact UserRow tuples straight away, so
+        only one page of Telethon objects is alive at a time, and the rows'
+        cache fingerprints are taken in the same pass. Pages the server
+        reports as unchanged come back with rows set to None.
+        """
+        page_hashes = page_hashes or {}
+        refreshed = False
         
-        try:
-            cursor.execute("""
-                INSERT INTO channels (
-                    id, channel_id, access_hash, title, username, 
-                    participants_count, is_megagroup, is_broadcast
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    access_hash = VALUES(access_hash),
-                    title = VALUES(title),
-                    username = VALUES(username),
-                    participants_count = VALUES(participants_count),
-                    scraped_at = CURRENT_TIMESTAMP
-            """, (
-                channel.id,
-                channel.id,
-                channel.access_hash if hasattr(channel, 'access_hash') else None,
-                channel.title,
-                channel.username if hasattr(channel, 'username') else None,
-                channel.participants_count if hasattr(channel, 'participants_count') else None,
-                channel.megagroup if hasattr(channel, 'megagroup') else False,
-                channel.broadcast if hasattr(channel, 'broadcast') else False
-            ))
-            
-            self.db_connection.commit()
+        while True:
+            # Send the stored hash so the server can answer "not modified" for known pages
+            stored_page = page_hashes.get(offset)
+            try:
+                participants = await self.throttle.call(self.client, GetParticipantsRequest(
+                    channel_entity,
+                    ChannelParticipantsSearch(''),
+                    offset,
+                    limit,
+                    hash=stored_page[0] if stored_page else 0
+                ))
+            except STALE_HASH_ERRORS:
+                if refreshed:
+                    raise
+                # The access hash was rejected: resolve the channel again and retry the page once
+                channel_entity = await self.entities.refresh(self.client, self.throttle, channel_entity.id)
+                refreshed = True
+                continue
             
-        except Exception as e:
-            logger.error(f"Error saving channel {channel.id}: {e}")
-            self.db_connection.rollback()
+            if isinstance(participants, ChannelParticipantsNotModified):
+                offset += stored_page[1]
+                yield offset, None, None, None
+                continue
+            
+            if not participants.users:
+                return
+            
+            rows, fingerprints = user_rows(participants.users)
+            del participants
+            
+            offset += len(rows)
+            yield offset, rows, participants_hash(row.id for row in rows), fingerprints
     
     async def scrape_channel(self, channel):
-        """Scrape all members from a channel"""
+        """Scrape all members from a channel; returns how many were scraped, or None when the scrape failed"""
         try:
-            # Get channel entity
-            channel_entity = await self.client.get_entity(channel)
+            # Dialog entities are used as they are, ids go through the stored access hashes
+            channel_entity = await self.entities.resolve(self.client, self.throttle, channel)
+            
+            # Try to get participants, picking up where a previous run stopped
+            offset = 0
+            if self.resume and channel_entity.id in self.checkpoints:
+                offset, completed = self.checkpoints[channel_entity.id]
+                if completed:
+                    logger.info(f"Skipping {channel_entity.title}: already finished in a previous run")
+                    return 0
+                logger.info(f"Resuming {channel_entity.title} from offset {offset}")
+            
+            page_hashes = {}
+            if self.incremental:
+                # Dialog entities usually lack the member count, so ask for it once
+                if getattr(channel_entity, 'participants_count', None) is None:
+                    full = await self.throttle.call(self.client, GetFullChannelRequest(channel_entity))
+                    channel_entity.participants_count = full.full_chat.participants_count
+                
+                if self.is_unchanged(channel_entity):
+                    logger.info(f"Skipping {channel_entity.title}: member count unchanged since last scrape")
+                    # Done as far as this run goes, so a --resume of it skips the channel too
+                    await self.writer.submit(self.writer.save_checkpoint, channel_entity.id,
+                                             self.checkpoints[channel_entity.id][0], True)
+                    return 0
+                
+                page_hashes = self.storage.transaction(self.storage.load_page_hashes, channel_entity.id)
+            
+            # Stored members to diff this run against; empty the first time a channel is seen
+            members = None
+            if self.track_changes:
+                members = self.storage.transaction(self.storage.load_member_ids, channel_entity.id)
+                joined = set()
+            # Every id listed this run, for leaves and the membership snapshot
+            seen = array('q') if self.track_changes or self.snapshots else None
+            # Leaves can only be told from a listing that saw every page
+            complete = offset == 0
+            failed = False
             
             # Save channel info
-            self.save_channel(channel_entity)
+            await self.writer.submit(self.writer.save_channel, channel_row(channel_entity))
+            await self.writer.submit(self.writer.save_checkpoint, channel_entity.id, offset)
             
             logger.info(f"Scraping channel: {channel_entity.title} (ID: {channel_entity.id})")
             
-            # Try to get participants
-            offset = 0
-            limit = 100
-            all_participants = []
-            
-            while True:
-                try:
-                    participants = await self.client(GetParticipantsRequest(
-                        channel_entity,
-                        ChannelParticipantsSearch(''),
-                        offset,
-                        limit,
-                        hash=0
-                    ))
-                    
-                    if not participants.users:
-                        break
+            # Only counters are kept per channel, so memory stays flat whatever its size
+            scraped_users = 0
+            unchanged_pages = 0
+            started = time.perf_counter()
+            
+            try:
+                async for offset, rows, page_hash, fingerprints in self.iter_participant_pages(channel_entity, offset, page_hashes):
+                    if rows is None:
+                        unchanged_pages += 1
+                        complete = False
+                        self.metrics.inc('telescrape_pages_total', status='unchanged')
+                        await self.writer.submit(self.writer.save_checkpoint, channel_entity.id, offset)
+                        continue
                     
-                    all_participants.extend(participants.users)
-                    offset += len(participants.users)
+                    scraped_users += len(rows)
+                    self.metrics.inc('telescrape_pages_total', status='changed')
+                    self.metrics.inc('telescrape_users_scraped_total', len(rows))
                     
-                    # Save users in batches
-                    for user in participants.users:
-                        self.save_user(user, channel_entity.id)
+                    joins = None
+                    if seen is not None:
+                        seen.extend(row.id for row in rows)
+                    # A first scrape is the baseline, not a wave of joins
+                    if members:
+                        # Pages can overlap when the member list shifts while we read it
+                        joins = [row.id for row in rows if row.id not in joined and not contains(members, row.id)]
+                        joined.update(joins)
                     
-                    logger.info(f"Scraped {offset} users from {channel_entity.title}")
+                    # Hand the page to the writer so fetching continues while it is stored
+                    await self.writer.submit(self.writer.save_users, rows, channel_entity.id, offset, page_hash, joins,
+                                             fingerprints)
                     
-                    # Avoid hitting rate limits
-                    await asyncio.sleep(1)
+                    logger.info(f"Scraped {offset} users from {channel_entity.title} "
+                                f"(pacing {self.throttle.delay:.2f}s)")
                     
-                except ChatAdminRequiredError:
-                    logger.warning(f"Admin rights required for {channel_entity.title}. Skipping...")
-                    break
+            except ChatAdminRequiredError:
+                logger.warning(f"Admin rights required for {channel_entity.title}. Skipping...")
+                complete = False
+                failed = True
+            
+            if complete and (members or self.snapshots):
+                # Sorted and diffed on the writer thread, so a large channel does not stall the event loop
+                await self.writer.submit(self.writer.save_listing, channel_entity.id, channel_entity.title, seen,
+                                         members, self.snapshots)
+            elif self.snapshots:
+                logger.info(f"No snapshot of {channel_entity.title}: not every page was listed this run")
+            
+            if not failed:
+                await self.writer.submit(self.writer.save_checkpoint, channel_entity.id, offset, True)
                     
-            logger.info(f"Finished scraping {channel_entity.title}. Total users: {len(all_participants)}")
-            return len(all_participants)
+            elapsed = time.perf_counter() - started
+            self.metrics.channel_done(channel_entity.id, channel_entity.title, scraped_users, elapsed, unchanged_pages)
+            
+            if unchanged_pages:
+                logger.info(f"{unchanged_pages} pages of {channel_entity.title} were unchanged")
+            logger.info(f"Finished scraping {channel_entity.title}. Total users: {scraped_users} "
+                        f"in {elapsed:.1f}s ({scraped_users / elapsed if elapsed else 0:.0f} users/sec)")
+            return None if failed else scraped_users
             
         except Exception as e:
             logger.error(f"Error scraping channel {channel}: {e}")
-            return 0
+            return None
     
     async def scrape_all_channels(self):
-        """Scrape all channels the user is a member of"""
+        """Scrape all channels the user is a member of, returning the number of members seen"""
         try:
-            # Get all dialogs (conversations)
-            dialogs = await self.client.get_dialogs()
-            
-            channels = []
-            for dialog in dialogs:
-                entity = dialog.entity
-                
-                # Check if it's a channel or supergroup
-                if hasattr(entity, 'megagroup') or hasattr(entity, 'broadcast'):
-                    channels.append(entity)
-            
-            logger.info(f"Found {len(channels)} channels/groups to scrape")
+            if self.resume or self.incremental:
+                self.load_checkpoints()
+            if not self.resume:
+                # Progress left by earlier runs must not make a --resume of this one skip channels it never reached
+                self.storage.transaction(self.storage.reset_checkpoints)
+            # Stored scrape times and sizes also decide the order channels are scraped in
+            self.channel_state = self.storage.load_channel_state()
+            self.entities.load(self.storage.load_access_hashes())
             
+            # Dialogs are streamed, so the first channel is scraped while the rest are still listed
             total_users = 0
-            for i, channel in enumerate(channels, 1):
-                logger.info(f"Processing channel {i}/{len(channels)}")
-                users_count = await self.scrape_channel(channel)
-                total_users += users_count
-                
-                # Add delay between channels
-                await asyncio.sleep(2)
+            processed = 0
+            async for channel in self.scheduler.channels(self.client, self.throttle, self.channel_state, self.entities):
+                processed += 1
+                logger.info(f"Processing channel {processed}/{self.scheduler.discovered} found so far")
+                total_users += await self.scrape_channel(channel) or 0
             
             logger.info(f"Scraping completed. Total users scraped: {total_users}")
+            logger.info(f"Throttle: final pacing {self.throttle.delay:.2f}s, "
+                        f"{self.throttle.flood_waits} flood waits, {self.throttle.slept:.0f}s spent sleeping")
+            return total_users
             
         except Exception as e:
             logger.error(f"Error during scraping: {e}")
+            return None
     
     async def run(self):
         """Main execution method"""
@@ -320,21 +630,80 @@ class TelegramScraper:
             await self.scrape_all_channels()
             
         finally:
-            # Clean up
-            if self.db_connection:
-                self.db_connection.close()
-            if self.client:
-                await self.client.disconnect()
-            
-            logger.info("Scraper finished")
+            await self.shutdown()
+    
+    async def shutdown(self):
+        """Flush the writer and close the database and Telegram connections"""
+        if self.writer:
+            # Flush off the event loop so Telethon keeps servicing the connection
+            await asyncio.get_running_loop().run_in_executor(None, self.writer.close)
+            logger.info(f"User cache: {self.user_cache.stats()}")
+        self.storage.close_pool()
+        if self.client:
+            await self.client.disconnect()
+        
+        logger.info("Scraper finished")
 
 async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--name', type=str, required=True, help='The username of the telegram user')
     parser.add_argument('--api_id', type=int, required=False, help='The user_id of the telegram user')
     parser.add_argument('--api_hash', type=str, required=False, help='The api_hash of the telegram user')
+    add_storage_arguments(parser)
+    parser.add_argument('--min-delay', type=float, default=0.3, help='Shortest pause between Telegram requests in seconds')
+    parser.add_argument('--max-delay', type=float, default=30.0, help='Longest pause the adaptive throttle backs off to in seconds')
+    parser.add_argument('--max-flood-wait', type=float, default=3600,
+                        help='Seconds of flood waits one request may sleep through before it is given up')
+    parser.add_argument('--write-queue', type=int, default=20, help='Max pages waiting to be written to the database')
+    parser.add_argument('--user-cache-size', type=int, default=200000, help='Users remembered to skip unchanged upserts (0 disables)')
+    parser.add_argument('--warm-cache', action='store_true', help='Preload the user cache from the database at startup')
+    parser.add_argument('--resume', action='store_true', help='Skip finished channels and continue partial ones from their checkpoint')
+    parser.add_argument('--incremental', action='store_true', help='Skip unchanged channels and pages using stored counts and page hashes '
+                             '(leaves are then only found when every page was read)')
+    parser.add_argument('--max-age', type=float, default=24, help='Hours after which --incremental re-checks a channel even if its count is unchanged')
+    parser.add_argument('--track-changes', action='store_true',
+                        help='Log joins, leaves and changed user fields instead of only overwriting them')
+    parser.add_argument('--bulk-load', type=str, metavar='DIR',
+                        help='Spool rows to staging files in DIR and bulk-load them in segments (for first scrapes)')
+    parser.add_argument('--bulk-segment-rows', type=int, default=500000,
+                        help='Rows spooled before a --bulk-load segment is loaded and merged')
+    parser.add_argument('--snapshots', type=str, metavar='DIR',
+                        help='Save each complete channel listing as a compact member id snapshot in DIR '
+                             '(compare them with snapshots.py)')
+    parser.add_argument('--order', choices=ORDERS, default='stale',
+                        help='Scrape order: least recently scraped first, smallest or largest first, or dialog order')
+    parser.add_argument('--include', action='append', default=[],
+                        help='Only scrape this channel (id, @username or title), first in the order given (repeatable)')
+    parser.add_argument('--exclude', action='append', default=[],
+                        help='Never scrape this channel (id, @username or title, repeatable)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running with warm connections, re-scraping each channel once it is stale')
+    parser.add_argument('--refresh-every', type=float, default=24,
+                        help='With --daemon, hours after which a channel is scraped again (default: 24)')
+    parser.add_argument('--schedule', action='append', default=[], metavar='NAME=HOURS',
+                        help='With --daemon, a different refresh interval for one channel (repeatable)')
+    parser.add_argument('--relist-every', type=float, default=60,
+                        help='With --daemon, minutes between dialog listings that pick up new channels (default: 60)')
+    parser.add_argument('--control-port', type=int,
+                        help='With --daemon, serve status/refresh/drain/stop on http://127.0.0.1:PORT')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run')
+    parser.add_argument('--metrics-report', type=str, help='Write a JSON report of timings and counters to this file when the run ends')
+    parser.add_argument('--profile', type=str, help='Profile the run with cProfile and write the stats to this file')
     
     args = parser.parse_args()
+    if args.bulk_load and args.track_changes:
+        parser.error("--track-changes compares against stored rows and cannot be used with --bulk-load")
+    if args.track_changes and (args.incremental or args.resume):
+        logger.warning("Leaves are only found in listings that read every page, which --incremental and --resume "
+                       "usually skip; run without them now and then so departures are recorded")
+    if args.daemon and args.resume:
+        parser.error("--resume skips finished channels, which --daemon exists to scrape again")
+    if args.daemon and args.bulk_load:
+        parser.error("--bulk-load merges its last segment when the run ends, which --daemon never does")
+    try:
+        schedule = parse_schedule(args.schedule)
+    except ValueError as e:
+        parser.error(f"--schedule: {e}")
     
     # Hardcoded database configuration
     db_config = {
@@ -346,16 +715,51 @@ async def main():
         'autocommit': False
     }
     
+    metrics = Metrics()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    
     # Create scraper instance
     scraper = TelegramScraper(
         session_name=args.name,
         api_id=args.api_id,
         api_hash=args.api_hash,
-        db_config=db_config
+        storage=create_storage(args.backend, db_config, args.sqlite_path, **storage_options(args)),
+        write_queue_size=args.write_queue,
+        resume=args.resume,
+        incremental=args.incremental,
+        max_age_hours=args.max_age,
+        throttle=AdaptiveThrottle(min_delay=args.min_delay, max_delay=args.max_delay, max_flood_wait=args.max_flood_wait),
+        user_cache_size=args.user_cache_size,
+        warm_cache=args.warm_cache,
+        metrics=metrics,
+        scheduler=ChannelScheduler(args.order, args.include, args.exclude),
+        track_changes=args.track_changes,
+        bulk_load=args.bulk_load,
+        bulk_segment_rows=args.bulk_segment_rows,
+        snapshots=args.snapshots
     )
     
+    profiler = None
+    if args.profile:
+        # Covers the event loop thread; use py-spy for the db-writer thread
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
     # Run the scraper
-    await scraper.run()
+    try:
+        if args.daemon:
+            await ScrapeDaemon(scraper, args.refresh_every, schedule, args.relist_every, args.control_port).run()
+        else:
+            await scraper.run()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logger.info(f"Wrote profile to {args.profile} (view with: python -m pstats {args.profile})")
+        if args.metrics_report:
+            metrics.write_report(args.metrics_report)
+        metrics.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
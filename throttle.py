@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+
+from telethon.errors import FloodWaitError, ServerError
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveThrottle:
+    """Paces Telegram requests from server feedback instead of fixed sleeps
+    
+    The delay between requests shrinks while calls succeed quickly, grows when
+    they get slow or fail, and jumps to at least the server's own figure after
+    a FloodWaitError. Flood waits and transient server errors are retried so
+    the caller keeps its place instead of abandoning the channel, until one
+    call has slept through max_flood_wait seconds of flood waits.
+    """
+    
+    def __init__(self, min_delay=0.3, max_delay=30.0, initial_delay=1.0, slow_latency=2.0,
+                 backoff=2.0, recovery=0.9, max_retries=5, max_flood_wait=3600, metrics=None):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = max(min_delay, min(initial_delay, max_delay))
+        self.slow_latency = slow_latency
+        self.backoff = backoff
+        self.recovery = recovery
+        self.max_retries = max_retries
+        self.max_flood_wait = max_flood_wait
+        self.last_request = 0.0
+        self.flood_waits = 0
+        self.slept = 0.0
+        self.metrics = metrics
+    
+    async def sleep(self, seconds):
+        """Sleep and account for the time spent"""
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+            self.slept += seconds
+            if self.metrics:
+                self.metrics.inc('telescrape_throttle_sleep_seconds_total', seconds)
+    
+    async def wait(self):
+        """Wait until the current pacing allows the next request"""
+        elapsed = time.monotonic() - self.last_request
+        await self.sleep(self.delay - elapsed)
+    
+    def on_success(self, latency):
+        """Recover towards the minimum delay, unless the server is answering slowly"""
+        if latency > self.slow_latency:
+            self.delay = min(self.max_delay, self.delay * 1.25)
+        else:
+            self.delay = max(self.min_delay, self.delay * self.recovery)
+    
+    def on_error(self):
+        """Back off after a transient failure"""
+        self.delay = min(self.max_delay, max(self.delay, self.min_delay, 0.5) * self.backoff)
+    
+    def on_flood_wait(self, seconds):
+        """Adopt the server's wait as the new floor for pacing"""
+        self.flood_waits += 1
+        self.delay = min(self.max_delay, max(self.delay * self.backoff, seconds / 10))
+        logger.warning(f"Flood wait of {seconds}s requested by Telegram, pacing now {self.delay:.2f}s")
+    
+    def record(self, method, started, error=None):
+        """Report the latency of a request that just finished to the metrics"""
+        if not self.metrics:
+            return
+        self.metrics.observe('telescrape_api_request_seconds', self.last_request - started, method=method)
+        if error:
+            self.metrics.inc('telescrape_api_errors_total', method=method, error=error)
+    
+    async def call(self, func, *args, **kwargs):
+        """Await func(*args, **kwargs) under the throttle, retrying flood waits and server errors"""
+        failures = 0
+        flood_waited = 0
+        # Requests sent through the client itself are named after the TL request
+        method = getattr(func, '__name__', None) or type(args[0]).__name__
+        
+        while True:
+            await self.wait()
+            started = time.monotonic()
+            
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.last_request = time.monotonic()
+                self.record(method, started, 'flood_wait')
+                self.on_flood_wait(e.seconds)
+                flood_waited += e.seconds
+                if flood_waited > self.max_flood_wait:
+                    logger.error(f"Giving up on {method} after {flood_waited}s of flood waits")
+                    raise
+                await self.sleep(e.seconds)
+                continue
+            except (ServerError, ConnectionError, asyncio.TimeoutError) as e:
+                self.last_request = time.monotonic()
+                self.record(method, started, 'transient')
+                failures += 1
+                if failures > self.max_retries:
+                    raise
+                self.on_error()
+                logger.warning(f"Transient error ({e}), retry {failures}/{self.max_retries} "
+                               f"with pacing {self.delay:.2f}s")
+                continue
+            
+            self.last_request = time.monotonic()
+            self.record(method, started)
+            self.on_success(self.last_request - started)
+            return result
@@ -1,239 +1,208 @@
 import argparse
-import pymysql
-from tabulate import tabulate
+import os
 import sys
 
+from exporters import EXPORTERS, create_exporter
+from overlap import OverlapMatrix
+from render import RENDERERS, Column, GridRenderer, create_renderer, handle, minutes, or_na, yes_no
+from storage import add_storage_arguments, create_storage, storage_options
+
+# Leading columns of every user listing
+USER_COLUMNS = [
+    Column('user_id', "User ID"),
+    Column('username', "Username", handle),
+    Column('first_name', "First Name", or_na),
+    Column('last_name', "Last Name", or_na),
+    Column('is_bot', "Bot", yes_no),
+    Column('is_verified', "Verified", yes_no),
+]
+
 class DataViewer:
-    def __init__(self, db_config):
-        self.db_config = db_config
-        self.connection = None
-        
+    def __init__(self, storage, renderer=None):
+        self.storage = storage
+        self.renderer = renderer or GridRenderer()
+    
     def connect(self):
         """Connect to the database"""
         try:
-            self.connection = pymysql.connect(**self.db_config)
-            self.connection.cursor().execute("USE telescrape")
+            self.storage.connect()
             return True
         except Exception as e:
             print(f"Error connecting to database: {e}")
             return False
     
-    def get_summary(self):
+    def get_summary(self, refresh=False):
         """Get overall summary statistics"""
-        cursor = self.connection.cursor()
-        
-        # Total users
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        # Total channels
-        cursor.execute("SELECT COUNT(*) FROM channels")
-        total_channels = cursor.fetchone()[0]
+        summary = self.storage.summary(refresh=refresh)
         
-        # Total user-channel relationships
-        cursor.execute("SELECT COUNT(*) FROM user_channel")
-        total_relationships = cursor.fetchone()[0]
-        
-        # Users with username
-        cursor.execute("SELECT COUNT(*) FROM users WHERE username IS NOT NULL")
-        users_with_username = cursor.fetchone()[0]
-        
-        # Bots
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_bot = TRUE")
-        bot_count = cursor.fetchone()[0]
-        
-        # Verified users
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_verified = TRUE")
-        verified_count = cursor.fetchone()[0]
+        if self.renderer.machine:
+            self.renderer.table([Column('statistic', "Statistic"), Column('value', "Value")], summary.items())
+            return
         
         print("\n=== SUMMARY ===")
-        print(f"Total unique users: {total_users}")
-        print(f"Total channels scraped: {total_channels}")
-        print(f"Total user-channel relationships: {total_relationships}")
-        print(f"Users with username: {users_with_username}")
-        print(f"Bot accounts: {bot_count}")
-        print(f"Verified accounts: {verified_count}")
+        print(f"Total unique users: {summary['total_users']}")
+        print(f"Total channels scraped: {summary['total_channels']}")
+        print(f"Total user-channel relationships: {summary['total_relationships']}")
+        print(f"Users with username: {summary['users_with_username']}")
+        print(f"Bot accounts: {summary['bot_count']}")
+        print(f"Verified accounts: {summary['verified_count']}")
     
     def list_channels(self):
         """List all channels with user counts"""
-        cursor = self.connection.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                c.title,
-                c.username,
-                c.participants_count,
-                COUNT(uc.user_id) as scraped_users,
-                c.is_megagroup,
-                c.scraped_at
-            FROM channels c
-            LEFT JOIN user_channel uc ON c.id = uc.channel_id
-            GROUP BY c.id
-            ORDER BY scraped_users DESC
-        """)
-        
-        channels = cursor.fetchall()
-        
-        print("\n=== CHANNELS ===")
-        headers = ["Title", "Username", "Total Members", "Scraped Users", "Type", "Scraped At"]
-        table_data = []
-        
-        for channel in channels:
-            table_data.append([
-                channel[0][:30] + "..." if len(channel[0]) > 30 else channel[0],
-                f"@{channel[1]}" if channel[1] else "N/A",
-                channel[2] if channel[2] else "N/A",
-                channel[3],
-                "Megagroup" if channel[4] else "Channel",
-                channel[5].strftime("%Y-%m-%d %H:%M")
-            ])
-        
-        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        self.renderer.note("\n=== CHANNELS ===")
+        self.renderer.table([
+            Column('title', "Title"),
+            Column('username', "Username", handle),
+            Column('participants_count', "Total Members", or_na),
+            Column('scraped_users', "Scraped Users"),
+            Column('megagroup', "Type", lambda megagroup: "Megagroup" if megagroup else "Channel"),
+            Column('scraped_at', "Scraped At", minutes),
+        ], self.storage.list_channels())
     
-    def search_users(self, query):
+    def search_users(self, query, limit=50):
         """Search for users by username or name"""
-        cursor = self.connection.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                u.user_id,
-                u.username,
-                u.first_name,
-                u.last_name,
-                u.is_bot,
-                u.is_verified,
-                COUNT(uc.channel_id) as channel_count
-            FROM users u
-            LEFT JOIN user_channel uc ON u.id = uc.user_id
-            WHERE u.username LIKE %s 
-               OR u.first_name LIKE %s 
-               OR u.last_name LIKE %s
-            GROUP BY u.id
-            LIMIT 50
-        """, (f"%{query}%", f"%{query}%", f"%{query}%"))
-        
-        users = cursor.fetchall()
-        
-        print(f"\n=== SEARCH RESULTS FOR '{query}' ===")
-        if not users:
-            print("No users found.")
-            return
-            
-        headers = ["User ID", "Username", "First Name", "Last Name", "Bot", "Verified", "Channels"]
-        table_data = []
-        
-        for user in users:
-            table_data.append([
-                user[0],
-                f"@{user[1]}" if user[1] else "N/A",
-                user[2] if user[2] else "N/A",
-                user[3] if user[3] else "N/A",
-                "Yes" if user[4] else "No",
-                "Yes" if user[5] else "No",
-                user[6]
-            ])
-        
-        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        self.renderer.note(f"\n=== SEARCH RESULTS FOR '{query}' ===")
+        if not self.renderer.table(USER_COLUMNS + [Column('channels', "Channels")],
+                                   self.storage.search_users(query, limit=limit)):
+            self.renderer.note("No users found.")
     
-    def show_channel_users(self, channel_name):
-        """Show users from a specific channel"""
-        cursor = self.connection.cursor()
-        
+    def build_search_index(self):
+        """Create the indexes used by --search"""
+        print("Building search index, this may take a while on large databases...")
+        self.storage.build_search_index()
+        print("Search index ready.")
+    
+    def show_channel_users(self, channel_name, page_size=100, after=None):
+        """Show one page of users from a specific channel, or all of them with page_size 0"""
         # First find the channel
-        cursor.execute("""
-            SELECT id, title FROM channels 
-            WHERE title LIKE %s OR username LIKE %s
-            LIMIT 1
-        """, (f"%{channel_name}%", f"%{channel_name}%"))
-        
-        channel = cursor.fetchone()
+        channel = self.storage.find_channel(channel_name)
         if not channel:
             print(f"Channel '{channel_name}' not found.")
             return
         
         channel_id, channel_title = channel
         
-        cursor.execute("""
-            SELECT 
-                u.user_id,
-                u.username,
-                u.first_name,
-                u.last_name,
-                u.is_bot,
-                u.is_verified,
-                uc.scraped_at
-            FROM users u
-            JOIN user_channel uc ON u.id = uc.user_id
-            WHERE uc.channel_id = %s
-            LIMIT 100
-        """, (channel_id,))
+        position = f"after user {after}" if after is not None else "from the start"
+        self.renderer.note(f"\n=== USERS IN '{channel_title}' ({position}) ===")
         
-        users = cursor.fetchall()
+        # Rows are printed as they stream in; only the last id is kept for the next page hint
+        last_id = after
         
-        print(f"\n=== USERS IN '{channel_title}' (showing first 100) ===")
-        headers = ["User ID", "Username", "First Name", "Last Name", "Bot", "Verified", "Scraped At"]
-        table_data = []
+        def users():
+            nonlocal last_id
+            for user in self.storage.channel_users(channel_id, after=after, limit=page_size or None):
+                last_id = user[0]
+                yield user
         
-        for user in users:
-            table_data.append([
-                user[0],
-                f"@{user[1]}" if user[1] else "N/A",
-                user[2] if user[2] else "N/A",
-                user[3] if user[3] else "N/A",
-                "Yes" if user[4] else "No",
-                "Yes" if user[5] else "No",
-                user[6].strftime("%Y-%m-%d %H:%M")
-            ])
+        shown = self.renderer.table(USER_COLUMNS + [Column('scraped_at', "Scraped At", minutes)], users())
+        self.renderer.note(f"{shown} users shown")
         
-        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        if page_size and shown == page_size:
+            self.renderer.note(f"Next page: --channel {channel_id} --after {last_id}")
+    
+    def show_changes(self, limit=50):
+        """Show the latest joins, leaves and user field changes"""
+        self.renderer.note("\n=== RECENT CHANGES ===")
+        if not self.renderer.table([
+            Column('changed_at', "When", minutes),
+            Column('user_id', "User ID"),
+            Column('change', "Change"),
+        ], self.storage.recent_changes(limit)):
+            self.renderer.note("No changes recorded. Scrape with --track-changes to record them.")
     
-    def export_users(self, output_file):
-        """Export all users to CSV"""
-        cursor = self.connection.cursor()
+    def overlap_matrix(self, cache_path, refresh=False):
+        """Membership matrix from cache_path, built from user_channel when missing or outdated"""
+        try:
+            return OverlapMatrix.cached(self.storage, cache_path, refresh)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return None
+    
+    def show_overlap(self, cache_path, refresh=False, limit=20, by='shared'):
+        """Show the channel pairs sharing the most members and how many channels users are in"""
+        overlap = self.overlap_matrix(cache_path, refresh)
+        if overlap is None:
+            return
         
-        cursor.execute("""
-            SELECT 
-                u.user_id,
-                u.access_hash,
-                u.username,
-                u.first_name,
-                u.last_name,
-                u.phone,
-                u.is_bot,
-                u.is_verified,
-                u.is_restricted,
-                u.is_scam,
-                u.is_fake,
-                GROUP_CONCAT(c.title SEPARATOR '; ') as channels
-            FROM users u
-            LEFT JOIN user_channel uc ON u.id = uc.user_id
-            LEFT JOIN channels c ON c.id = uc.channel_id
-            GROUP BY u.id
-        """)
+        titles = self.storage.channel_titles()
         
-        users = cursor.fetchall()
+        def title(channel_id):
+            return titles.get(channel_id) or str(channel_id)
         
-        import csv
-        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                'User ID', 'Access Hash', 'Username', 'First Name', 'Last Name',
-                'Phone', 'Is Bot', 'Is Verified', 'Is Restricted', 'Is Scam', 
-                'Is Fake', 'Channels'
-            ])
-            writer.writerows(users)
+        self.renderer.note(f"\n=== CHANNEL OVERLAP (top {limit} by {by}) ===")
+        self.renderer.table([
+            Column('channel', "Channel", title),
+            Column('other_channel', "Channel", title),
+            Column('shared_users', "Shared Users"),
+            Column('jaccard', "Jaccard", lambda jaccard: f"{jaccard:.3f}"),
+        ], overlap.top_pairs(limit, by))
         
-        print(f"Exported {len(users)} users to {output_file}")
+        self.renderer.note("\n=== USERS BY NUMBER OF CHANNELS ===")
+        self.renderer.table([Column('channels', "Channels"), Column('users', "Users")], overlap.multiplicity())
+    
+    def show_multi_channel_users(self, min_channels, cache_path, refresh=False, limit=50):
+        """Show the users present in at least min_channels channels"""
+        overlap = self.overlap_matrix(cache_path, refresh)
+        if overlap is None:
+            return
+        
+        user_ids, total = overlap.users_in_at_least(min_channels, limit)
+        
+        self.renderer.note(f"\n=== USERS IN {min_channels}+ CHANNELS ({total} total, {len(user_ids)} shown) ===")
+        self.renderer.table(USER_COLUMNS + [Column('channels', "Channels")],
+                            self.storage.users_with_channel_counts(user_ids))
+    
+    def export_users(self, output_file, format=None):
+        """Stream all users to CSV, JSON Lines or Parquet"""
+        try:
+            exporter = create_exporter(output_file, format)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return
+        
+        exported = 0
+        try:
+            for batch in self.storage.export_users():
+                exporter.write(batch)
+                exported += len(batch)
+        finally:
+            exporter.close()
+        
+        print(f"Exported {exported} users to {output_file}")
 
 def main():
     parser = argparse.ArgumentParser(description='View Telegram scraper data')
     
     # Commands
     parser.add_argument('--summary', action='store_true', help='Show summary statistics')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Recompute the summary statistics or overlap matrix instead of reading the stored ones')
     parser.add_argument('--channels', action='store_true', help='List all channels')
     parser.add_argument('--search', type=str, help='Search for users')
-    parser.add_argument('--channel', type=str, help='Show users from specific channel')
-    parser.add_argument('--export', type=str, help='Export users to CSV file')
+    parser.add_argument('--limit', type=int, default=50, help='Most users shown by --search (default: 50)')
+    parser.add_argument('--build-search-index', action='store_true', help='Create the username and name search indexes')
+    parser.add_argument('--channel', type=str, help='Show users from a channel, by id, @username or part of the title')
+    parser.add_argument('--page-size', type=int, default=100, help='Users per page for --channel, 0 for the whole channel (default: 100)')
+    parser.add_argument('--after', type=int, help='For --channel, start after this user id (printed at the end of each page)')
+    parser.add_argument('--changes', action='store_true', help='Show the latest membership and user field changes')
+    parser.add_argument('--overlap', action='store_true',
+                        help='Show the channel pairs sharing the most members and how many channels users are in')
+    parser.add_argument('--min-channels', type=int, help='Show users present in at least this many channels')
+    parser.add_argument('--top', type=int, default=20, help='Channel pairs shown by --overlap (default: 20)')
+    parser.add_argument('--by', choices=['shared', 'jaccard'], default='shared',
+                        help='Rank --overlap pairs by shared users or by Jaccard similarity')
+    parser.add_argument('--overlap-cache', type=str, default='overlap.npz',
+                        help='File the membership matrix is cached in between runs (default: overlap.npz)')
+    parser.add_argument('--export', type=str, help='Export users to a file (.csv, .jsonl or .parquet)')
+    parser.add_argument('--format', choices=sorted(EXPORTERS), help='Export format (default: from the file extension)')
+    parser.add_argument('--output', choices=sorted(RENDERERS), default='grid',
+                        help='Print tables as a grid, tab-separated values or JSON Lines (default: grid)')
+    parser.add_argument('--sample-rows', type=int, default=100,
+                        help='Rows measured to size grid columns before printing; 0 prints at once with '
+                             'fixed widths (default: 100)')
+    parser.add_argument('--max-width', type=int, default=40,
+                        help='Widest grid column, longer values are cut short (default: 40)')
+    add_storage_arguments(parser)
     
     args = parser.parse_args()
     
@@ -246,29 +215,49 @@ def main():
         'charset': 'utf8mb4'
     }
     
-    viewer = DataViewer(db_config)
+    viewer = DataViewer(
+        create_storage(args.backend, db_config, args.sqlite_path, **storage_options(args)),
+        create_renderer(args.output, args.sample_rows, args.max_width)
+    )
     
     if not viewer.connect():
         sys.exit(1)
     
     # Execute requested command
-    if args.summary or not any([args.channels, args.search, args.channel, args.export]):
-        viewer.get_summary()
+    if args.summary or not any([args.channels, args.search, args.build_search_index, args.channel, args.changes,
+                                args.overlap, args.min_channels, args.export]):
+        viewer.get_summary(refresh=args.refresh)
     
     if args.channels:
         viewer.list_channels()
     
+    if args.build_search_index:
+        viewer.build_search_index()
+    
     if args.search:
-        viewer.search_users(args.search)
+        viewer.search_users(args.search, args.limit)
     
     if args.channel:
-        viewer.show_channel_users(args.channel)
+        viewer.show_channel_users(args.channel, args.page_size, args.after)
+    
+    if args.changes:
+        viewer.show_changes()
+    
+    if args.overlap:
+        viewer.show_overlap(args.overlap_cache, args.refresh, args.top, args.by)
+    
+    if args.min_channels:
+        viewer.show_multi_channel_users(args.min_channels, args.overlap_cache, args.refresh)
     
     if args.export:
-        viewer.export_users(args.export)
+        viewer.export_users(args.export, args.format)
     
-    if viewer.connection:
-        viewer.connection.close()
+    viewer.storage.close_pool()
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except BrokenPipeError:
+        # Output piped into head or less that exited early; silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)